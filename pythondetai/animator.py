@@ -1,238 +1,1075 @@
 # animator.py
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, GifImagePlugin
 from io import BytesIO
 import os
+import glob
 import math
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from imageio import v2 as imageio
 import cv2
 import numpy as np
+from videoindex import get_index, seek_to_frame
+from resizer import fit_size, resize_array, resize_image
+from renderstats import NO_STATS, frame_nbytes, resolve_stats
+from framestore import DEFAULT_SPILL_BYTES, FrameStore
+from cachefiles import atomic_path
 
 
-def _make_fade_frames(img1, img2, n):
-    frames = []
-    img1 = img1.convert("RGBA").resize(img2.size)
-    img2 = img2.convert("RGBA").resize(img1.size)
-    for i in range(1, n + 1):
-        alpha = i / (n + 1)
-        blended = Image.blend(img1, img2, alpha)
-        frames.append(blended.convert("RGB"))
-    return frames
-
-def _make_slide_frames(img1, img2, n):
-    frames = []
-    img1 = img1.convert("RGBA").resize(img2.size)
-    img2 = img2.convert("RGBA").resize(img1.size)
-    w, h = img1.size
-    for i in range(1, n + 1):
-        alpha = i / (n + 1)
-        offset = int(alpha * w)
-        canvas = Image.new("RGBA", (w, h))
-        canvas.paste(img1, (-offset, 0))
-        canvas.paste(img2, (w - offset, 0), img2)
-        frames.append(canvas.convert("RGB"))
-    return frames
-
-def create_gif(images, fps=60, effect='none', inter_frames=0, watermark_text=None, duration_ms=None):
-    if len(images) < 1:
-        raise ValueError("Cần ít nhất 1 ảnh.")
-    if duration_ms is None:
-        duration_ms = max(20, int(1000 / max(1, fps)))
-    base_size = images[0].size
-
-    norm_images = []
-    for im in images:
-        if im.size != base_size:
-            norm_images.append(im.resize(base_size))
+# Số khung tính cùng lúc trong một lô float32; lô nhỏ nằm gọn trong cache nên nhanh hơn lô lớn
+_TRANSITION_BATCH = 2
+
+
+def _frame_size(frame):
+    """Kích thước (w, h) của một khung: ảnh PIL hoặc mảng (H,W[,C])."""
+    if isinstance(frame, np.ndarray):
+        return frame.shape[1], frame.shape[0]
+    return frame.size
+
+
+def _rgb_array(frame, size=None):
+    """
+    Đưa một khung (ảnh PIL bất kỳ mode, hoặc mảng xám/RGB/RGBA uint8) về mảng RGB uint8 (H,W,3)
+    liền bộ nhớ, resize về size=(w, h) nếu có. Mảng RGB đúng kích thước được trả về nguyên,
+    không sao chép; ảnh PIL chỉ bị sao chép một lần khi chuyển sang mảng.
+    """
+    if isinstance(frame, np.ndarray):
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+        elif frame.shape[2] == 4:
+            frame = frame[..., :3]  # bỏ kênh alpha như convert("RGB")
+        if size is not None:
+            frame = resize_array(frame, size)
+        return np.ascontiguousarray(frame)
+    if frame.mode != "RGB":
+        frame = frame.convert("RGB")
+    if size is not None:
+        frame = resize_image(frame, size)
+    return np.asarray(frame)
+
+
+def _pair_arrays(img1, img2):
+    """
+    Trả về cặp mảng uint8 (H,W,3) liền bộ nhớ, ảnh thứ nhất được resize theo kích thước ảnh thứ hai.
+    Nhận ảnh PIL hoặc mảng RGB; hai mảng RGB cùng kích thước được dùng nguyên.
+    """
+    b = _rgb_array(img2)
+    return _rgb_array(img1, _frame_size(b)), b
+
+
+def _fade_batch(a, b, n, out=None):
+    """
+    Tính cả n khung mờ dần giữa hai mảng uint8 (H,W,3) bằng tổng có trọng số.
+    Khớp đúng Image.blend: a + alpha * (b - a) trên float32 rồi cắt về uint8;
+    tổng luôn nằm trong [0, 255] nên không cần bước clip.
+    Trả về mảng (n,H,W,3) uint8, ghi thẳng vào out nếu có (vd. một vùng của FrameStore).
+    """
+    alphas = np.array([i / (n + 1) for i in range(1, n + 1)]).astype(np.float32)
+    if out is None:
+        out = np.empty((n,) + a.shape, dtype=np.uint8)
+    base = a.astype(np.float32)
+    diff = b.astype(np.float32) - base
+    mixed = np.empty((min(n, _TRANSITION_BATCH),) + a.shape, dtype=np.float32)
+    for start in range(0, n, _TRANSITION_BATCH):
+        w = alphas[start:start + _TRANSITION_BATCH].reshape(-1, 1, 1, 1)
+        chunk = mixed[:len(w)]
+        np.multiply(diff, w, out=chunk)
+        chunk += base
+        out[start:start + len(w)] = chunk
+    return out
+
+
+def _slide_batch(a, b, n, out=None):
+    """
+    Tính cả n khung trượt giữa hai mảng uint8 (H,W,3).
+    Mỗi khung là một cửa sổ rộng w trên [a | b], dịch sang int(alpha * w) cột.
+    Trả về mảng (n,H,W,3) uint8, ghi thẳng vào out nếu có.
+    """
+    w = a.shape[1]
+    strip = np.concatenate([a, b], axis=1)
+    offsets = [int(i / (n + 1) * w) for i in range(1, n + 1)]
+    if out is None:
+        out = np.empty((n,) + a.shape, dtype=np.uint8)
+    for i, off in enumerate(offsets):
+        out[i] = strip[:, off:off + w]
+    return out
+
+
+def _make_fade_frames(img1, img2, n, spill_bytes=DEFAULT_SPILL_BYTES):
+    """n khung chuyển cảnh mờ dần, trong một FrameStore (xuống đĩa nếu vượt spill_bytes)."""
+    a, b = _pair_arrays(img1, img2)
+    store = FrameStore(a.shape, spill_bytes, capacity=n)
+    _fade_batch(a, b, n, out=store.allocate(n))
+    return store
+
+def _make_slide_frames(img1, img2, n, spill_bytes=DEFAULT_SPILL_BYTES):
+    """n khung chuyển cảnh trượt, trong một FrameStore (xuống đĩa nếu vượt spill_bytes)."""
+    a, b = _pair_arrays(img1, img2)
+    store = FrameStore(a.shape, spill_bytes, capacity=n)
+    _slide_batch(a, b, n, out=store.allocate(n))
+    return store
+
+# Số khung (đã lấy mẫu) dùng để dựng một bảng màu chung, cũng là kích thước cửa sổ nhìn trước
+_PALETTE_WINDOW = 16
+# Tổng số điểm ảnh lấy mẫu tối đa đưa vào median cut khi dựng bảng màu
+_PALETTE_SAMPLE_PIXELS = 1 << 18
+# Số bit mỗi kênh của bảng tra RGB -> chỉ số màu (64^3 ô)
+_LUT_BITS = 6
+# Ma trận Bayer 8x8 cho dithering có thứ tự, chuẩn hóa về khoảng [-0.5, 0.5)
+_BAYER_8 = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.float32) / 64.0 - 0.5
+
+
+def build_palette(frames, colors=256):
+    """
+    Dựng một bảng màu chung (mảng (K,3) uint8, K <= colors) từ một mẫu các khung (PIL hoặc mảng RGB).
+    Điểm ảnh được lấy mẫu thưa rồi lượng tử hóa bằng median cut của Pillow.
+    """
+    arrays = [_rgb_array(f) for f in frames]
+    if not arrays:
+        raise ValueError("Cần ít nhất 1 khung để dựng bảng màu.")
+    total = sum(a.shape[0] * a.shape[1] for a in arrays)
+    stride = max(1, int(math.sqrt(total / _PALETTE_SAMPLE_PIXELS)))
+    pixels = np.concatenate([a[::stride, ::stride].reshape(-1, 3) for a in arrays])
+    sample = Image.frombytes("RGB", (len(pixels), 1), np.ascontiguousarray(pixels).tobytes())
+    quantized = sample.quantize(colors, method=Image.Quantize.MEDIANCUT)
+    used = len(quantized.getcolors(colors) or []) or colors
+    return np.array(quantized.getpalette()[:used * 3], dtype=np.uint8).reshape(-1, 3)
+
+
+class PaletteMapper:
+    """
+    Ánh xạ khung RGB sang chỉ số của một bảng màu cố định bằng bảng tra 3D
+    (RGB rút gọn còn _LUT_BITS bit mỗi kênh -> chỉ số màu gần nhất), tính một lần
+    rồi dùng lại cho mọi khung. Tùy chọn dithering có thứ tự (Bayer 8x8).
+    """
+
+    def __init__(self, palette):
+        self.palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+        self.palette_bytes = self.palette.tobytes()
+        self._lut = self._build_lut(self.palette.astype(np.float32))
+        # biên độ dither xấp xỉ nửa khoảng cách giữa hai màu kề nhau trong bảng màu
+        self._dither_spread = 128.0 / max(1.0, len(self.palette) ** (1.0 / 3.0))
+
+    @staticmethod
+    def _build_lut(palette):
+        n = 1 << _LUT_BITS
+        centers = (np.arange(n, dtype=np.float32) + 0.5) * (256.0 / n)
+        cells = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), -1).reshape(-1, 3)
+        norms = (palette * palette).sum(axis=1)
+        lut = np.empty(len(cells), dtype=np.uint8)
+        chunk = 1 << 15
+        for start in range(0, len(cells), chunk):
+            # |c - p|^2 = |c|^2 - 2 c.p + |p|^2, bỏ |c|^2 vì không ảnh hưởng argmin
+            dist = norms[None, :] - 2.0 * (cells[start:start + chunk] @ palette.T)
+            lut[start:start + chunk] = dist.argmin(axis=1)
+        return lut
+
+    def map(self, rgb, dither=False):
+        """Trả về mảng chỉ số (H,W) uint8 cho mảng RGB (H,W,3) uint8."""
+        if dither:
+            h, w = rgb.shape[:2]
+            tile = np.tile(_BAYER_8, ((h + 7) // 8, (w + 7) // 8))[:h, :w, None]
+            rgb = np.clip(rgb + tile * self._dither_spread, 0, 255).astype(np.uint8)
+        shift = 8 - _LUT_BITS
+        q = (rgb >> shift).astype(np.uint32)
+        return self._lut[(q[..., 0] << (2 * _LUT_BITS)) | (q[..., 1] << _LUT_BITS) | q[..., 2]]
+
+    def quantize(self, frame, dither=False):
+        """Trả về ảnh PIL chế độ "P" dùng bảng màu của mapper (frame: mảng RGB hoặc ảnh PIL)."""
+        indices = self.map(_rgb_array(frame), dither)
+        im = Image.frombytes("P", _frame_size(frame), np.ascontiguousarray(indices).tobytes())
+        im.putpalette(self.palette_bytes)
+        return im
+
+
+def sample_evenly(items, count=_PALETTE_WINDOW):
+    """Tối đa count phần tử lấy đều trên cả dãy items (ảnh, khung hoặc đường dẫn) để dựng bảng màu chung."""
+    if len(items) <= count:
+        return list(items)
+    return [items[i * (len(items) - 1) // max(count - 1, 1)] for i in range(count)]
+
+
+def _quantize_frames(timed_frames, palette='global', colors=256, dither=False, sample=None):
+    """
+    Generator lượng tử hóa các cặp (khung RGB, thời lượng) về ảnh "P" với bảng màu dùng chung.
+    palette='global': một bảng màu cho cả chuỗi, dựng từ sample nếu có,
+                      nếu không thì từ cửa sổ _PALETTE_WINDOW khung đầu tiên.
+    palette='scene':  dựng lại bảng màu cho mỗi cửa sổ _PALETTE_WINDOW khung.
+    Chỉ giữ tối đa một cửa sổ khung trong bộ nhớ.
+    """
+    timed_frames = iter(timed_frames)
+    mapper = None
+    if sample and palette == 'global':
+        mapper = PaletteMapper(build_palette(sample, colors))
+    while True:
+        window = list(itertools.islice(timed_frames, _PALETTE_WINDOW))
+        if not window:
+            return
+        if mapper is None or palette == 'scene':
+            mapper = PaletteMapper(build_palette([frame for frame, _ in window], colors))
+        for frame, duration in window:
+            yield mapper.quantize(frame, dither), duration
+
+
+def _timed_frames(frames, duration_ms):
+    """
+    Ghép mỗi khung với thời lượng hiển thị (ms).
+    duration_ms là một số cho mọi khung, hoặc danh sách thời lượng cho từng khung đầu ra.
+    """
+    if isinstance(duration_ms, (int, float)):
+        durations = itertools.repeat(duration_ms)
+    else:
+        durations = iter(duration_ms)
+    for frame in frames:
+        duration = next(durations, None)
+        if duration is None:
+            raise ValueError("Danh sách duration_ms ít hơn số khung GIF.")
+        yield frame, duration
+
+
+def _timed_nbytes(item):
+    # số byte của khung trong cặp (khung, thời lượng), cho RenderStats.track
+    return frame_nbytes(item[0])
+
+
+def _collapse_frames(timed_frames, tolerance=0):
+    """
+    Gộp các khung liên tiếp giống nhau thành một khung với thời lượng cộng dồn.
+    Hai khung được coi là giống nhau khi chênh lệch lớn nhất trên mọi kênh <= tolerance
+    (so với khung đầu tiên của chuỗi giống nhau, nên sai lệch không bị cộng dồn).
+    Nhận và yield các cặp (khung, thời lượng ms).
+    """
+    held = held_array = None
+    held_duration = 0
+    for frame, duration in timed_frames:
+        if held is not None:
+            if frame is held:
+                held_duration += duration
+                continue
+            array = np.asarray(frame)
+            if array.shape == held_array.shape:
+                if tolerance <= 0:
+                    same = np.array_equal(array, held_array)
+                else:
+                    same = cv2.absdiff(array, held_array).max() <= tolerance
+                if same:
+                    held_duration += duration
+                    continue
+            yield held, held_duration
         else:
-            norm_images.append(im)
-    final_frames = []
-    for i in range(len(norm_images) - 1):
-        a = norm_images[i].convert("RGB")
-        b = norm_images[i + 1].convert("RGB")
-
-        final_frames.append(a)
-        if inter_frames > 0:
-            if effect.lower() == 'fade':
-                mids = _make_fade_frames(a, b, inter_frames)
-            elif effect.lower() == 'slide':
-                mids = _make_slide_frames(a, b, inter_frames)
-            else:
-                mids = [a.copy() for _ in range(inter_frames)]
-            final_frames.extend(mids)
-    last = norm_images[-1].convert("RGB")
-
-    final_frames.append(last)
-    buffer = BytesIO()
-    final_frames[0].save(
-        buffer,
-        format="GIF",
-        save_all=True,
-        append_images=final_frames[1:],
-        loop=0,
-        optimize=True,  # nén palette
-        duration=int(1000 / fps),
-    )
-    buffer.seek(0)
-    return buffer
-
-def create_video(images, fps=30, effect='none', inter_frames=0, watermark_text=None, output_path='output.mp4'):
-    """
-    Tạo video MP4 từ danh sách PIL.Image.
-    Sử dụng imageio (ffmpeg backend). output_path được trả về.
+            array = np.asarray(frame)
+        held, held_array, held_duration = frame, array, duration
+    if held is not None:
+        yield held, held_duration
+
+
+# Tỉ lệ điểm không đổi tối thiểu trong vùng thay đổi để chế độ delta dùng màu trong suốt
+_DELTA_MIN_UNCHANGED = 0.25
+
+
+class GifStreamWriter:
+    """
+    Ghi GIF động từng khung một, không giữ các khung đã ghi trong bộ nhớ.
+    fp có thể là đường dẫn file hoặc file object mở ở chế độ nhị phân.
+    Khung đầu tiên cung cấp kích thước canvas và bảng màu toàn cục.
+    Khung RGB (mảng hoặc ảnh PIL) được lượng tử hóa riêng (ADAPTIVE); khung "P" được ghi nguyên,
+    và chỉ kèm bảng màu cục bộ khi bảng màu của nó khác bảng màu toàn cục.
+    delta=True: so sánh với khung đang hiển thị, chỉ ghi hình chữ nhật bao vùng thay đổi
+    (disposal 1 - giữ khung trước), điểm không đổi trong vùng đó dùng màu trong suốt.
+    stats: RenderStats nhận các công đoạn quantize, encode và write.
     """
-    if len(images) < 1:
-        raise ValueError("Cần ít nhất 1 ảnh để tạo video.")
-    base_size = images[0].size
 
-    # Đảm bảo kích thước chia hết cho 16 để tránh cảnh báo FFmpeg
-    w, h = base_size
-    w = (w + 15) // 16 * 16
-    h = (h + 15) // 16 * 16
-    base_size = (w, h)
+    def __init__(self, fp, duration=100, loop=0, delta=False, stats=None):
+        self._owns_fp = isinstance(fp, (str, bytes, os.PathLike))
+        self._fp = open(fp, "wb") if self._owns_fp else fp
+        self.duration = duration
+        self.loop = loop
+        self.delta = delta
+        self.stats = resolve_stats(stats)
+        self.frame_count = 0
+        self._global_palette = None
+        self._previous = None
 
-    norm_images = []
-    for im in images:
-        if im.size != base_size:
-            norm_images.append(im.resize(base_size))
+    def _delta_frame(self, im, params):
+        """
+        Cắt khung "P" về hình chữ nhật thay đổi so với khung trước.
+        Trả về (ảnh đã cắt, offset, params) để ghi.
+        """
+        palette = im.getpalette()
+        indices = np.asarray(im)
+        previous, self._previous = self._previous, (indices, palette)
+        params["disposal"] = 1  # giữ nguyên khung trước, khung sau vẽ đè lên
+        if previous is None:
+            return im, (0, 0), params
+
+        prev_indices, prev_palette = previous
+        if palette == prev_palette:
+            changed = indices != prev_indices
+        else:
+            # bảng màu khác nhau: so sánh màu thực sự hiển thị
+            rgb = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)[indices]
+            prev_rgb = np.asarray(prev_palette, dtype=np.uint8).reshape(-1, 3)[prev_indices]
+            changed = (rgb != prev_rgb).any(axis=2)
+        rows = np.flatnonzero(changed.any(axis=1))
+        if rows.size == 0:
+            # khung giống hệt: chỉ cần một điểm ảnh để giữ nhịp thời gian
+            y0, y1, x0, x1 = 0, 1, 0, 1
         else:
-            norm_images.append(im)
-    final_frames = []
-    for i in range(len(norm_images) - 1):
-        a = norm_images[i].convert("RGB")
-        b = norm_images[i + 1].convert("RGB")
-
-        final_frames.append(a)
-        if inter_frames > 0:
-            if effect == 'fade':
-                mids = _make_fade_frames(a, b, inter_frames)
-            elif effect == 'slide':
-                mids = _make_slide_frames(a, b, inter_frames)
+            cols = np.flatnonzero(changed.any(axis=0))
+            y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        sub = indices[y0:y1, x0:x1].copy()
+        keep = changed[y0:y1, x0:x1]
+        # Điểm không đổi rải rác làm đứt các chuỗi LZW, chỉ dùng trong suốt khi chúng đủ nhiều
+        if keep.mean() <= 1.0 - _DELTA_MIN_UNCHANGED:
+            # chỉ số màu trong suốt: bất kỳ màu nào của bảng màu không dùng cho điểm thay đổi
+            used = np.bincount(sub[keep], minlength=256)[:len(palette) // 3]
+            free = np.flatnonzero(used == 0)
+            if free.size:
+                transparent = int(free[0])
+                sub[~keep] = transparent
+                params["transparency"] = transparent
+        crop = Image.frombytes("P", (x1 - x0, y1 - y0), sub.tobytes())
+        crop.putpalette(palette)
+        return crop, (int(x0), int(y0)), params
+
+    def append(self, frame, duration=None):
+        """Ghi một khung; duration (ms) ghi đè thời lượng mặc định của writer."""
+        stats = self.stats
+        if isinstance(frame, np.ndarray):
+            with stats.stage("quantize"):
+                im = Image.fromarray(frame).convert("P", palette=Image.Palette.ADAPTIVE)
+            stats.count("quantize", 1, frame_nbytes(im))
+        elif frame.mode == "P":
+            im = frame
+        else:
+            with stats.stage("quantize"):
+                im = frame.convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+            stats.count("quantize", 1, frame_nbytes(im))
+        with stats.stage("encode"):
+            params = {"duration": self.duration if duration is None else duration}
+            offset = (0, 0)
+            if self.delta:
+                im, offset, params = self._delta_frame(im, params)
+            if self.frame_count == 0:
+                header, _ = GifImagePlugin.getheader(im, info={"loop": self.loop, "duration": self.duration})
+                self._global_palette = im.getpalette()
+                chunks = header + GifImagePlugin.getdata(im, **params)
+            else:
+                params["include_color_table"] = im.getpalette() != self._global_palette
+                chunks = GifImagePlugin.getdata(im, offset, **params)
+        nbytes = sum(len(chunk) for chunk in chunks)
+        stats.count("encode", 1, nbytes)
+        with stats.stage("write"):
+            for chunk in chunks:
+                self._fp.write(chunk)
+        stats.count("write", 1, nbytes)
+        self.frame_count += 1
+
+    def close(self):
+        if self._fp is None:
+            return
+        with self.stats.stage("write"):
+            self._fp.write(b";")  # GIF trailer
+            if self._owns_fp:
+                self._fp.close()
             else:
-                mids = []
-            final_frames.extend(mids)
-    last = norm_images[-1].convert("RGB")
+                self._fp.flush()
+        self.stats.count("write", 0, 1)
+        self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
-    final_frames.append(last)
-    # write with imageio
-    writer = imageio.get_writer(output_path, fps=fps)
-    for frame in final_frames:
-        # convert PIL Image to numpy array
-        writer.append_data(np.asarray(frame))
-    writer.close()
-    return output_path
 
-def extract_frames_from_video(video_path: str, target_fps: int, max_duration: float, output_dir: str):
+def _iter_frames(images, effect='none', inter_frames=0, hold_frames=True, align=1, stats=NO_STATS,
+                 spill_bytes=DEFAULT_SPILL_BYTES):
     """
-    Extract frames from a video at a specified target_fps for up to max_duration seconds.
-    Saves images into output_dir and returns list of saved file paths.
-    Uses accurate timestamp sampling (not simple every Nth frame).
+    Generator sinh lần lượt các khung đầu ra (ảnh gốc + khung chuyển cảnh) dưới dạng
+    mảng RGB uint8 (H,W,3) liền bộ nhớ; chỉ bộ mã hóa mới chuyển sang PIL nếu cần.
+    images (ảnh PIL hoặc mảng, xem _rgb_array) có thể là list hoặc generator;
+    chỉ giữ hai ảnh liền kề trong bộ nhớ.
+    Mọi ảnh được đưa về kích thước ảnh đầu, làm tròn lên bội số của align (mỗi ảnh resize đúng một lần).
+    hold_frames: với effect 'none', lặp lại ảnh inter_frames lần (GIF) hay bỏ qua (video).
+    Không sinh khung nào nếu images rỗng.
+    stats nhận các công đoạn normalize (đổi mode + resize) và transition.
+    Khung chuyển cảnh được tính vào một FrameStore (spill_bytes, xem framestore).
+    """
+    it = iter(images)
+    first = next(it, None)
+    if first is None:
+        return
+    w, h = _frame_size(first)
+    base_size = ((w + align - 1) // align * align, (h + align - 1) // align * align)
+    a = None
+    for im in itertools.chain([first], it):
+        with stats.stage("normalize"):
+            b = _rgb_array(im, base_size)
+        stats.count("normalize", 1, frame_nbytes(b))
+        if a is not None:
+            yield a
+            if inter_frames > 0:
+                if effect.lower() in ('fade', 'slide'):
+                    make = _make_fade_frames if effect.lower() == 'fade' else _make_slide_frames
+                    with stats.stage("transition"):
+                        between = make(a, b, inter_frames, spill_bytes)
+                    stats.count("transition", len(between), between.nbytes)
+                    with between:
+                        yield from between  # view vào store, không sao chép
+                elif hold_frames:
+                    # cùng một mảng, phía GIF sẽ gộp thành một khung dài hơn
+                    for _ in range(inter_frames):
+                        yield a
+        a = b
+    yield a
+
+
+def preview_frames(images, max_size=(560, 420), effect='none', inter_frames=0):
+    """
+    Generator sinh trực tiếp các khung xem trước (PIL RGB) vừa khung max_size,
+    không qua bước mã hóa rồi giải mã GIF.
+    Ảnh nguồn được thu nhỏ trước theo tỉ lệ của ảnh đầu (như create_gif chuẩn hóa
+    kích thước), nên chuyển cảnh chỉ tính trên ảnh nhỏ.
+    """
+    it = iter(images)
+    first = next(it, None)
+    if first is None:
+        raise ValueError("Cần ít nhất 1 ảnh.")
+    size = fit_size(_frame_size(first), max_size)
+    small = (resize_image(im, size) if not isinstance(im, np.ndarray) else resize_array(im, size)
+             for im in itertools.chain([first], it))
+    last = shown = None
+    for frame in _iter_frames(small, effect, inter_frames):
+        # khung hiển thị là ranh giới chuyển sang PIL; khung giữ (cùng mảng) trả lại đúng ảnh cũ
+        # để FramePlayer nhận ra và không dán lại
+        if frame is not last:
+            last, shown = frame, Image.fromarray(frame)
+        yield shown
+
+
+def create_gif(images, fps=60, effect='none', inter_frames=0, watermark_text=None, duration_ms=None, output=None,
+               palette=None, colors=256, dither=False, delta=False, collapse=True, collapse_tolerance=0,
+               stats=None, profiler=None, spill_bytes=DEFAULT_SPILL_BYTES, palette_sample=None):
+    """
+    Tạo GIF từ danh sách (hoặc generator) PIL.Image hoặc mảng RGB uint8 (H,W,3).
+    Các khung được sinh và ghi từng khung một (GifStreamWriter) nên bộ nhớ gần như
+    không đổi theo số khung. Mặc định trả về BytesIO chứa toàn bộ GIF; nếu có output
+    (đường dẫn hoặc file object) thì ghi thẳng vào đó và trả về output; đường dẫn được ghi
+    qua file tạm nên lỗi/hủy giữa chừng không để lại GIF dở dang.
+    palette=None lượng tử hóa từng khung riêng như trước; 'global' hoặc 'scene' dùng
+    bảng màu chung (colors màu, dither=True bật dithering có thứ tự), xem _quantize_frames.
+    Bảng màu 'global' dựng từ palette_sample (các ảnh lấy đều trên cả chuỗi, xem sample_evenly())
+    hoặc lấy đều từ images nếu images là list/tuple; không có mẫu nào (images là generator)
+    thì dùng 'scene' để phần sau của chuỗi không bị khóa vào bảng màu của vài ảnh đầu.
+    delta=True chỉ ghi vùng thay đổi giữa hai khung liên tiếp, xem GifStreamWriter.
+    duration_ms: thời lượng mỗi khung (ms), hoặc danh sách thời lượng cho từng khung đầu ra;
+    mặc định 1000 / fps (tối thiểu 20ms).
+    collapse=True gộp các khung liên tiếp giống nhau (chênh lệch <= collapse_tolerance)
+    thành một khung hiển thị lâu hơn, nên các đoạn dừng chỉ tốn một khung đã mã hóa.
+    stats=True (hoặc một RenderStats) đo từng công đoạn load, normalize, transition, collapse,
+    quantize, encode, write và trả về (kết quả, RenderStats).
+    profiler: cProfile.Profile() hoặc hàm tracer, chỉ bật trong lần render này (xem renderstats.profiling).
+    spill_bytes: ngưỡng để các khung phải giữ cùng lúc (các khung chuyển cảnh) được chuyển
+    xuống file memmap trên đĩa thay vì giữ trong RAM, xem framestore.FrameStore.
+    """
+    st = resolve_stats(stats)
+    with st.render(profiler):
+        if duration_ms is None:
+            duration_ms = max(20, int(1000 / max(1, fps)))
+        if palette not in (None, 'global', 'scene'):
+            raise ValueError(f"Chế độ bảng màu không hợp lệ: {palette}")
+        frames = _iter_frames(st.track("load", images), effect, inter_frames, stats=st, spill_bytes=spill_bytes)
+        first = next(frames, None)  # báo lỗi danh sách rỗng trước khi mở file
+        if first is None:
+            raise ValueError("Cần ít nhất 1 ảnh.")
+
+        timed = _timed_frames(itertools.chain([first], frames), duration_ms)
+        if collapse:
+            timed = st.track("collapse", _collapse_frames(timed, collapse_tolerance), _timed_nbytes)
+
+        if palette is not None:
+            # bảng màu toàn cục lấy mẫu đều trên cả chuỗi ảnh nguồn
+            sample = palette_sample
+            if sample is None and isinstance(images, (list, tuple)):
+                sample = sample_evenly(images)
+            if palette == 'global' and not sample:
+                palette = 'scene'
+            timed = st.track("quantize", _quantize_frames(timed, palette, colors, dither, sample), _timed_nbytes)
+
+        # Luôn ghi từng khung một (thời lượng đã gộp theo từng khung nên không cần biết trước
+        # cả chuỗi như khi đưa cho Pillow), bộ nhớ không tăng theo số khung
+        target = output if output is not None else BytesIO()
+        if isinstance(target, (str, os.PathLike)):
+            with atomic_path(target) as tmp_path, GifStreamWriter(tmp_path, loop=0, delta=delta, stats=st) as writer:
+                for frame, duration in timed:
+                    writer.append(frame, duration)
+        else:
+            with GifStreamWriter(target, loop=0, delta=delta, stats=st) as writer:
+                for frame, duration in timed:
+                    writer.append(frame, duration)
+        if output is None:
+            target.seek(0)
+        result = target
+    return (result, st) if stats else result
+
+
+# Số khung tối đa chờ ghi giữa luồng sinh khung và luồng mã hóa
+_ENCODE_QUEUE_SIZE = 8
+
+
+def _append_frames(writer, frames, queue_size=_ENCODE_QUEUE_SIZE, stats=NO_STATS):
+    """
+    Đưa từng khung (mảng RGB) cho writer.append_data trên một luồng nền,
+    để việc mã hóa chạy song song với việc sinh khung.
+    Hàng đợi có giới hạn nên bộ nhớ chỉ chứa tối đa queue_size khung.
+    Lỗi của luồng ghi được ném lại ở luồng gọi.
+    Thời gian append_data được tính vào công đoạn encode của stats (trên luồng nền).
     """
-    if not os.path.exists(video_path):
-        raise FileNotFoundError("Video không tồn tại.")
+    pending = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if errors:
+                continue  # bỏ qua phần còn lại để luồng sinh khung không bị chặn
+            try:
+                with stats.stage("encode"):
+                    writer.append_data(item)
+                stats.count("encode", 1)
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        for frame in frames:
+            if errors:
+                break
+            pending.put(frame)
+    finally:
+        pending.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def create_video(images, fps=30, effect='none', inter_frames=0, watermark_text=None, output_path='output.mp4',
+                 background=True, stats=None, profiler=None, spill_bytes=DEFAULT_SPILL_BYTES):
+    """
+    Tạo video MP4 từ danh sách (hoặc generator) PIL.Image hoặc mảng RGB uint8 (H,W,3).
+    Sử dụng imageio (ffmpeg backend). output_path được trả về.
+    Các khung được sinh lười và ghi từng khung một; với background=True
+    việc mã hóa chạy trên luồng nền song song với việc sinh khung.
+    Video được ghi vào file tạm cạnh output_path rồi mới đổi tên, nên khi lỗi hoặc bị hủy
+    giữa chừng không để lại file dở dang (file cũ ở output_path, nếu có, được giữ nguyên).
+    stats=True (hoặc một RenderStats) đo các công đoạn load, normalize, transition, encode
+    và trả về (output_path, RenderStats); ffmpeg vừa mã hóa vừa ghi file nên encode gồm cả
+    ghi đĩa, số byte của nó là kích thước file. profiler: xem create_gif (chỉ luồng gọi).
+    spill_bytes: ngưỡng chuyển khung chuyển cảnh xuống đĩa, xem create_gif.
+    """
+    st = resolve_stats(stats)
+    with st.render(profiler):
+        # Đảm bảo kích thước chia hết cho 16 để tránh cảnh báo FFmpeg
+        frames = _iter_frames(st.track("load", images), effect, inter_frames, hold_frames=False, align=16, stats=st,
+                              spill_bytes=spill_bytes)
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("Cần ít nhất 1 ảnh để tạo video.")
+        frames = itertools.chain([first], frames)
+
+        # write with imageio
+        with atomic_path(output_path) as tmp_path:
+            writer = imageio.get_writer(tmp_path, fps=fps)
+            try:
+                if background:
+                    _append_frames(writer, frames, stats=st)
+                else:
+                    for frame in frames:
+                        with st.stage("encode"):
+                            writer.append_data(frame)
+                        st.count("encode", 1)
+            finally:
+                with st.stage("encode"):
+                    writer.close()
+        if st:
+            st.count("encode", 0, os.path.getsize(output_path))
+    return (output_path, st) if stats else output_path
+
+# Khoảng cách lớn nhất (tính bằng khung nguồn) giữa hai mốc lấy mẫu mà việc
+# grab() tuần tự vẫn rẻ hơn seek; thưa hơn mức này thì quay lại seek từng mốc
+_SEQUENTIAL_MAX_GAP = 120
+
+
+def _read_frame_at(cap, ts, orig_fps, frame_count):
+    """
+    Seek tới ts (giây) rồi đọc một khung, như cách lấy mẫu cũ.
+    Trả về khung BGR hoặc None nếu không đọc được.
+    """
+    cap.set(cv2.CAP_PROP_POS_MSEC, ts * 1000.0)
+    ret, frame = cap.read()
+    if not ret:
+        # try to read by frame index fallback
+        frame_index = int(min(math.floor(ts * orig_fps), frame_count - 1))
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        ret, frame = cap.read()
+    return frame if ret else None
+
+
+def _video_end(cap, index=None):
+    """
+    Thời điểm (giây) ngay sau khung cuối của video: theo chỉ mục nếu có, không thì
+    theo số khung / FPS mà file khai báo. Không xác định được thì trả về vô cực.
+    """
+    if index is not None and index.frame_count:
+        return float(index.timestamps[-1]) + 1.0 / index.fps
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+    return frame_count / fps if fps > 0 and frame_count > 0 else math.inf
+
+
+def _iter_indexed_frames(cap, index, timestamps):
+    """
+    Lấy mẫu theo kế hoạch của VideoIndex: với mỗi mốc chọn grab() tiếp hoặc seek,
+    tùy cách nào phải giải mã ít khung hơn (xem VideoIndex.plan_seek).
+    cap phải vừa được mở (khung kế tiếp là khung 0). Yield (mốc, khung).
+    """
+    current = 0  # chỉ số khung mà grab() kế tiếp sẽ trả về
+    frame = None
+    for ts in timestamps:
+        target = index.frame_at(ts)
+        if frame is not None and target == current - 1:
+            yield ts, frame  # nhiều mốc rơi vào cùng một khung nguồn
+            continue
+        if not seek_to_frame(cap, index, target, current) or not cap.grab():
+            return
+        current = target + 1
+        ret, frame = cap.retrieve()
+        if not ret:
+            frame = None
+            continue
+        yield ts, frame
+
+
+def _iter_sampled_frames(cap, timestamps, orig_fps, frame_count, decode_mode='auto', index=None):
+    """
+    Trả về (mốc thời gian, khung BGR) cho từng mốc được yêu cầu (mốc không đọc được bị bỏ qua,
+    nên nơi gọi cần ghép khung với thời gian phải dùng mốc được trả về).
+    decode_mode:
+      'seek'       - tua tới trước mỗi mốc (cách làm cũ).
+      'sequential' - đi qua luồng video một lần: grab() mọi khung, chỉ retrieve() những
+                     khung có chỉ số trùng lưới lấy mẫu; chỉ mốc đầu tiên là phải tua tới.
+      'auto'       - sequential, trừ khi các mẫu cách nhau quá _SEQUENTIAL_MAX_GAP khung gốc.
+    Có VideoIndex (xem videoindex.get_index) thì không cần decode_mode: mỗi mẫu được lấy
+    bằng cách grab tiếp hoặc tua tới, tùy cách nào giải mã ít khung hơn theo bảng keyframe.
+    Ở mọi chế độ, các mốc từ cuối video trở đi (xem _video_end) bị bỏ thay vì lặp lại khung cuối.
+    """
+    if decode_mode not in ('auto', 'seek', 'sequential'):
+        raise ValueError(f"decode_mode không hợp lệ: {decode_mode}")
+    end = _video_end(cap, index)
+    timestamps = list(itertools.takewhile(lambda ts: ts < end, timestamps))
+    if index is not None:
+        yield from _iter_indexed_frames(cap, index, timestamps)
+        return
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or orig_fps
+    targets = [int(ts * video_fps + 0.5) for ts in timestamps]
+    if decode_mode == 'auto':
+        gaps = [b - a for a, b in zip(targets, targets[1:])]
+        decode_mode = 'seek' if gaps and min(gaps) > _SEQUENTIAL_MAX_GAP else 'sequential'
+
+    done = 0
+    if decode_mode == 'sequential' and timestamps:
+        current = -1  # chỉ số khung vừa grab()
+        if targets[0] > 0:
+            cap.set(cv2.CAP_PROP_POS_MSEC, timestamps[0] * 1000.0)
+            current = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+        frame = None
+        for ts, target in zip(timestamps, targets):
+            ended = False
+            while current < target:
+                if not cap.grab():
+                    ended = True
+                    break
+                current += 1
+                frame = None
+            if ended:
+                break
+            if frame is None:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    frame = None
+            if frame is not None:
+                yield ts, frame
+            done += 1
+
+    # Chế độ seek, hoặc các mốc còn lại sau khi luồng đọc tuần tự kết thúc sớm
+    for ts in timestamps[done:]:
+        frame = _read_frame_at(cap, ts, orig_fps, frame_count)
+        if frame is not None:
+            yield ts, frame
+
+
+def iter_video_frames(video_path, timestamps, decode_mode='auto', use_index=True, with_timestamps=False):
+    """
+    Mở video_path và yield khung BGR tại từng mốc trong timestamps (giây, tăng dần);
+    mốc không đọc được bị bỏ qua, with_timestamps=True thì yield (mốc, khung) để biết khung thuộc mốc nào.
+    Seek được lập kế hoạch theo chỉ mục video nếu use_index, xem _iter_sampled_frames;
+    chỉ mục chưa có thì được lập nền cho lần sau, lần này seek theo cách thường.
+    """
+    index = get_index(video_path, wait=False) if use_index else None
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise IOError("Không thể mở video.")
-    orig_fps =  min(10, cap.get(cv2.CAP_PROP_FPS))  # giảm FPS xuống 10
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-    orig_duration = frame_count / orig_fps if orig_fps > 0 else 0
-    duration = min(orig_duration, max_duration)
-    if duration <= 0:
+    try:
+        orig_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        sampled = _iter_sampled_frames(cap, timestamps, orig_fps, frame_count, decode_mode, index)
+        if with_timestamps:
+            yield from sampled
+        else:
+            for _, frame in sampled:
+                yield frame
+    finally:
         cap.release()
-        raise ValueError("Video có thời lượng không hợp lệ.")
-    os.makedirs(output_dir, exist_ok=True)
-    timestamps = []
-    step = 1.0 / float(target_fps)
-    t = 0.0
-    while t < duration - 1e-6:
-        timestamps.append(t)
-        t += step
-    # Ensure last frame at duration - small epsilon
-    if len(timestamps) == 0:
-        timestamps = [0.0]
-    saved_paths = []
-    idx = 0
-    for ts in timestamps:
-        # set position by time in milliseconds
-        cap.set(cv2.CAP_PROP_POS_MSEC, ts * 1000.0)
-        ret, frame = cap.read()
-        if not ret:
-            # try to read by frame index fallback
-            frame_index = int(min(math.floor(ts * orig_fps), frame_count - 1))
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
-            ret, frame = cap.read()
-            if not ret:
-                continue
-        # save as PNG
-        filename = f"frame_{idx:04d}.png"
-        outpath = os.path.join(output_dir, filename)
-        cv2.imwrite(outpath, frame)
-        saved_paths.append(outpath)
-        idx += 1
-    cap.release()
-    return {
-        "saved_paths": saved_paths,
-        "requested_fps": target_fps,
-        "duration_used": duration,
-        "orig_fps": orig_fps,
-        "orig_duration": orig_duration
-    }
 
-# -------------------------
-# New helper: create GIF directly from a video segment (returns BytesIO)
-def create_gif_from_video(video_path: str, start_sec: float, end_sec: float, fps: int = 10, effect='none', inter_frames=0, max_duration: float = 15.0):
+
+# Phần mở rộng file theo định dạng ảnh xuất
+_IMAGE_FORMATS = {'png': '.png', 'jpg': '.jpg', 'jpeg': '.jpg', 'npy': '.npy'}
+
+
+class FrameWriter:
     """
-    Extract frames from video between start_sec and end_sec at given fps,
-    then call create_gif(...) to produce a BytesIO buffer (GIF).
-    Returns BytesIO.
+    Ghi khung BGR (từ cv2) ra đĩa trên một thread pool, để việc nén ảnh và I/O
+    chạy song song với việc giải mã video.
+    image_format: 'png', 'jpg' hoặc 'npy' (mảng RGB thô, không nén).
+    quality: mức nén PNG (0-9) hoặc chất lượng JPEG (0-100); None dùng mặc định của OpenCV.
+    Số khung đang chờ ghi bị giới hạn bởi max_pending nên bộ nhớ không tăng theo độ dài video.
+    stats: RenderStats nhận công đoạn write (nén + ghi đĩa, trên các luồng của pool).
     """
-    if not os.path.exists(video_path):
-        raise FileNotFoundError("Video không tồn tại.")
+
+    def __init__(self, image_format='png', quality=None, threads=None, max_pending=None, stats=None):
+        fmt = image_format.lower()
+        if fmt not in _IMAGE_FORMATS:
+            raise ValueError(f"Định dạng ảnh không hỗ trợ: {image_format}")
+        self.image_format = 'jpg' if fmt == 'jpeg' else fmt
+        self.ext = _IMAGE_FORMATS[fmt]
+        self.quality = quality
+        self.stats = resolve_stats(stats)
+        threads = threads or min(4, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._slots = threading.BoundedSemaphore(max_pending or threads * 4)
+        self._futures = []
+
+    def _write(self, frame, path):
+        try:
+            with self.stats.stage("write"):
+                self._encode(frame, path)
+            if self.stats:
+                self.stats.count("write", 1, os.path.getsize(path))
+        finally:
+            self._slots.release()
+
+    def _encode(self, frame, path):
+        if self.image_format == 'npy':
+            np.save(path, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            return
+        params = []
+        if self.quality is not None:
+            flag = cv2.IMWRITE_PNG_COMPRESSION if self.image_format == 'png' else cv2.IMWRITE_JPEG_QUALITY
+            params = [flag, int(self.quality)]
+        if not cv2.imwrite(path, frame, params):
+            raise IOError(f"Không thể ghi ảnh: {path}")
+
+    def submit(self, frame, path):
+        """Đưa một khung vào hàng đợi ghi; chặn lại nếu đã có max_pending khung đang chờ."""
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._write, frame, path))
+
+    def close(self):
+        """Chờ ghi xong mọi khung; ném lại lỗi ghi đầu tiên nếu có."""
+        self._pool.shutdown(wait=True)
+        futures, self._futures = self._futures, []
+        for f in futures:
+            f.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Mỗi đoạn của chế độ trích xuất song song có ít nhất chừng này mốc thời gian,
+# tránh chi phí mở VideoCapture + seek cho các đoạn quá nhỏ
+_MIN_SEGMENT_FRAMES = 8
+
+
+def _split_segments(timestamps, workers):
+    """
+    Chia danh sách mốc thời gian thành tối đa workers đoạn liên tiếp, kích thước gần bằng nhau.
+    """
+    count = max(1, min(workers, len(timestamps) // _MIN_SEGMENT_FRAMES))
+    size, extra = divmod(len(timestamps), count)
+    segments = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        segments.append(timestamps[start:end])
+        start = end
+    return segments
+
+
+def _extract_segment(video_path, timestamps, orig_fps, frame_count, output_dir, segment, decode_mode,
+                     image_format='png', quality=None, use_index=False):
+    """
+    Worker của chế độ trích xuất song song (chạy trong process riêng).
+    Mở VideoCapture riêng, lấy mẫu các mốc của một đoạn và lưu với tên tạm theo đoạn.
+    use_index: nạp chỉ mục video (process cha đã lập và lưu vào cache đĩa).
+    Trả về danh sách đường dẫn đã lưu theo thứ tự.
+    """
+    index = get_index(video_path) if use_index else None
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise IOError("Không thể mở video.")
-    orig_fps = cap.get(cv2.CAP_PROP_FPS) or 60.0
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-    orig_duration = frame_count / orig_fps if orig_fps > 0 else 0
-
-    # sanitize start/end
-    start = float(max(0.0, min(start_sec, orig_duration)))
-    end = float(max(start, min(end_sec, orig_duration)))
-    duration = min(end - start, max_duration)
-    if duration <= 0:
+    paths = []
+    try:
+        with FrameWriter(image_format, quality) as writer:
+            sampled = _iter_sampled_frames(cap, timestamps, orig_fps, frame_count, decode_mode, index)
+            for k, (_, frame) in enumerate(sampled):
+                outpath = os.path.join(output_dir, f".segment{segment:03d}_{k:05d}{writer.ext}")
+                writer.submit(frame, outpath)
+                paths.append(outpath)
+    finally:
         cap.release()
-        raise ValueError("Đoạn thời gian không hợp lệ hoặc bằng 0.")
-
-    # collect timestamps
-    step = 1.0 / float(max(1, fps))
-    timestamps = []
-    t = start
-    while t < start + duration - 1e-6:
-        timestamps.append(t)
-        t += step
-    if len(timestamps) == 0:
-        timestamps = [start]
-
-    frames = []
-    for ts in timestamps:
-        cap.set(cv2.CAP_PROP_POS_MSEC, ts * 1000.0)
-        ret, frame = cap.read()
-        if not ret:
-            # fallback by frame index
-            frame_index = int(min(math.floor(ts * orig_fps), frame_count - 1))
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
-            ret, frame = cap.read()
-            if not ret:
-                continue
-        # convert BGR -> RGB and to PIL
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(frame_rgb)
-        frames.append(pil_img)
+    return paths
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _remove_segment_files(output_dir, count, ext):
+    """Xóa các file tạm .segmentNNN_* của count đoạn còn sót lại trong output_dir."""
+    for segment in range(count):
+        for path in glob.glob(os.path.join(glob.escape(output_dir), f".segment{segment:03d}_*{ext}")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def extract_frames_from_video(video_path: str, target_fps: int, max_duration: float, output_dir: str,
+                              decode_mode: str = 'auto', workers: int = 1, image_format: str = 'png',
+                              quality=None, progress=None, use_index=True, stats=None, profiler=None):
+    """
+    Extract frames from a video at a specified target_fps for up to max_duration seconds.
+    Saves images into output_dir and returns list of saved file paths.
+    Uses accurate timestamp sampling (not simple every Nth frame).
+    decode_mode selects how sampled frames are reached, see _iter_sampled_frames.
+    workers > 1 splits the timestamps into contiguous segments decoded by a process
+    pool, each worker with its own VideoCapture; workers=None uses every CPU core.
+    Workers are spawned (never forked from a threaded process), so scripts need the
+    usual ``if __name__ == "__main__"`` guard.
+    Output numbering and the returned dict are the same as the serial path.
+    Frames are written by a FrameWriter thread pool in image_format ('png', 'jpg'
+    or 'npy') with the given PNG compression level / JPEG quality.
+    progress(done, total) is called after each saved frame (after each finished
+    segment in parallel mode); an exception raised from it aborts the extraction
+    (in parallel mode pending segments are cancelled and temporary files removed).
+    use_index plans seeks from the cached keyframe/timestamp index of the file
+    (built on a background thread on first use, see videoindex.get_index; until
+    it is ready sampling falls back to plain seeking).
+    stats=True (or a RenderStats) records the decode and write stages and returns
+    (info, RenderStats); in parallel mode the segments stage is the time spent
+    waiting for the worker processes. profiler: see create_gif.
+    """
+    st = resolve_stats(stats)
+    with st.render(profiler):
+        if not os.path.exists(video_path):
+            raise FileNotFoundError("Video không tồn tại.")
+        index = get_index(video_path, wait=False) if use_index else None
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError("Không thể mở video.")
+        orig_fps =  min(10, cap.get(cv2.CAP_PROP_FPS))  # giảm FPS xuống 10
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        orig_duration = frame_count / orig_fps if orig_fps > 0 else 0
+        # không lấy mốc sau khung cuối, để duration_used và tổng tiến độ khớp số khung thật
+        duration = min(orig_duration, max_duration, _video_end(cap, index))
+        if duration <= 0:
+            cap.release()
+            raise ValueError("Video có thời lượng không hợp lệ.")
+        ext = _IMAGE_FORMATS.get(image_format.lower())
+        if ext is None:
+            cap.release()
+            raise ValueError(f"Định dạng ảnh không hỗ trợ: {image_format}")
+        os.makedirs(output_dir, exist_ok=True)
+        timestamps = []
+        step = 1.0 / float(target_fps)
+        t = 0.0
+        while t < duration - 1e-6:
+            timestamps.append(t)
+            t += step
+        # Ensure last frame at duration - small epsilon
+        if len(timestamps) == 0:
+            timestamps = [0.0]
+        saved_paths = []
+        idx = 0
+        if workers is None:
+            workers = os.cpu_count() or 1
+        segments = _split_segments(timestamps, workers)
+        if len(segments) > 1:
+            cap.release()
+            # spawn: không fork process đang có thread (luồng ghi, thread pool của người gọi)
+            pool = ProcessPoolExecutor(max_workers=len(segments), mp_context=multiprocessing.get_context("spawn"))
+            try:
+                futures = [
+                    pool.submit(_extract_segment, video_path, seg, orig_fps, frame_count, output_dir, i, decode_mode,
+                                image_format, quality, index is not None)
+                    for i, seg in enumerate(segments)
+                ]
+                parts = []
+                for f in futures:
+                    with st.stage("segments"):
+                        parts.append(f.result())
+                    st.count("segments", len(parts[-1]))
+                    if progress is not None:
+                        progress(sum(len(p) for p in parts), len(timestamps))
+                pool.shutdown()
+                # ghép các đoạn theo thứ tự, đánh số lại liên tục như chế độ tuần tự
+                for part in parts:
+                    for tmp_path in part:
+                        outpath = os.path.join(output_dir, f"frame_{idx:04d}{ext}")
+                        os.replace(tmp_path, outpath)
+                        saved_paths.append(outpath)
+                        idx += 1
+            except BaseException:
+                # hủy các đoạn chưa chạy, chờ các đoạn đang chạy rồi xóa file tạm của mọi đoạn
+                # và các khung đã kịp đổi tên
+                pool.shutdown(cancel_futures=True)
+                _remove_segment_files(output_dir, len(segments), ext)
+                _remove_files(saved_paths)
+                raise
+        else:
+            try:
+                # nén + ghi đĩa chạy trên thread pool, luồng này chỉ lo giải mã
+                with FrameWriter(image_format, quality, stats=st) as writer:
+                    sampled = _iter_sampled_frames(cap, timestamps, orig_fps, frame_count, decode_mode, index)
+                    for frame in st.track("decode", (frame for _, frame in sampled)):
+                        filename = f"frame_{idx:04d}{ext}"
+                        outpath = os.path.join(output_dir, filename)
+                        writer.submit(frame, outpath)
+                        saved_paths.append(outpath)
+                        idx += 1
+                        if progress is not None:
+                            progress(idx, len(timestamps))
+            except BaseException:
+                _remove_files(saved_paths)  # không để lại một bộ khung dở dang (vd. khi bị hủy)
+                raise
+            finally:
+                cap.release()
+        info = {
+            "saved_paths": saved_paths,
+            "requested_fps": target_fps,
+            "duration_used": duration,
+            "orig_fps": orig_fps,
+            "orig_duration": orig_duration
+        }
+    return (info, st) if stats else info
+
+
+# -------------------------
+# New helper: create GIF directly from a video segment (returns BytesIO)
+def _iter_video_rgb(video_path, timestamps, max_size=None, decode_mode='auto', use_index=True, progress=None):
+    """
+    Trả về mảng RGB uint8 tại các mốc thời gian, thu nhỏ (INTER_AREA) cho vừa max_size và
+    đổi hệ màu ngay sau khi giải mã, nên khung độ phân giải đầy đủ không sống quá một vòng lặp.
+    """
+    for done, frame in enumerate(iter_video_frames(video_path, timestamps, decode_mode, use_index), 1):
+        if max_size is not None:
+            frame = resize_array(frame, fit_size((frame.shape[1], frame.shape[0]), max_size))
+        yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if progress is not None:
+            progress(done, len(timestamps))
+
+
+def create_gif_from_video(video_path: str, start_sec: float, end_sec: float, fps: int = 10, effect='none', inter_frames=0, max_duration: float = 15.0,
+                          decode_mode: str = 'auto', use_index=True, max_size=None, output=None, progress=None,
+                          stats=None, profiler=None, **gif_options):
+    """
+    Extract frames from video between start_sec and end_sec at given fps (at most
+    max_duration seconds) and stream them straight into the GIF encoder.
+    decode_mode selects how sampled frames are reached, see _iter_sampled_frames;
+    use_index plans those seeks from the cached video index (once it has been
+    built in the background, see videoindex.get_index).
+    max_size=(w, h) downscales every frame at decode time; only one decoded frame
+    is alive at a time, the encoder writes as frames arrive.
+    output: path or file object to write to (see create_gif); default a new BytesIO.
+    progress(done, total) is called after each decoded frame; raising from it aborts.
+    Extra keyword arguments (palette, delta, dither, ...) are passed to create_gif.
+    Returns output (the BytesIO by default).
+    stats=True (or a RenderStats) adds the decode stage to the create_gif stages and
+    returns (output, RenderStats); profiler: see create_gif.
+    """
+    st = resolve_stats(stats)
+    with st.render(profiler):
+        if not os.path.exists(video_path):
+            raise FileNotFoundError("Video không tồn tại.")
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError("Không thể mở video.")
+        orig_fps = cap.get(cv2.CAP_PROP_FPS) or 60.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        cap.release()
+        orig_duration = frame_count / orig_fps if orig_fps > 0 else 0
+
+        # sanitize start/end
+        start = float(max(0.0, min(start_sec, orig_duration)))
+        end = float(max(start, min(end_sec, orig_duration)))
+        duration = min(end - start, max_duration)
+        if duration <= 0:
+            raise ValueError("Đoạn thời gian không hợp lệ hoặc bằng 0.")
 
-    cap.release()
+        # collect timestamps
+        step = 1.0 / float(max(1, fps))
+        timestamps = []
+        t = start
+        while t < start + duration - 1e-6:
+            timestamps.append(t)
+            t += step
+        if len(timestamps) == 0:
+            timestamps = [start]
 
-    if not frames:
-        raise ValueError("Không tìm thấy khung hợp lệ trong đoạn đã chọn.")
+        # decode gồm cả thu nhỏ + đổi màu ngay sau khi giải mã
+        frames = st.track("decode", _iter_video_rgb(video_path, timestamps, max_size, decode_mode, use_index, progress))
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("Không tìm thấy khung hợp lệ trong đoạn đã chọn.")
 
-    # create gif buffer using existing create_gif
-    buffer = create_gif(frames, fps=fps, effect=effect, inter_frames=inter_frames)
-    return buffer
+        # create gif using the streaming writer of create_gif
+        target = output if output is not None else BytesIO()
+        create_gif(itertools.chain([first], frames), fps=fps, effect=effect, inter_frames=inter_frames,
+                   output=target, stats=st, **gif_options)
+        if output is None:
+            target.seek(0)
+    return (target, st) if stats else target
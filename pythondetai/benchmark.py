@@ -0,0 +1,293 @@
+# benchmark.py
+"""
+Đo hiệu năng các đường nóng của animator trên dữ liệu tổng hợp sinh tại chỗ.
+
+    python benchmark.py --quick --out ket_qua.json
+    python benchmark.py --out moi.json --compare cu.json
+
+Mỗi kịch bản chạy trong một process riêng (spawn) để đỉnh RSS đo được là của riêng
+kịch bản đó; kết quả gồm thời gian, số khung/giây, đỉnh RSS và thời gian từng công đoạn
+(RenderStats), lưu ra JSON. Mỗi lần chạy dùng một thư mục cache đĩa trống riêng;
+các kịch bản extract/video-gif lập chỉ mục trước (ngoài phần đo) rồi mới đo, nên luôn
+đo đường seek theo chỉ mục mà không có thread lập chỉ mục nền chạy chen vào.
+--compare so với một lần chạy trước và trả mã lỗi 1 nếu có kịch bản chậm hơn ngưỡng.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import resource  # không có trên Windows
+except ImportError:
+    resource = None
+
+# (rộng, cao) của ảnh/video tổng hợp
+FULL_RESOLUTIONS = [(640, 480), (1920, 1080), (3840, 2160)]
+QUICK_RESOLUTIONS = [(320, 240), (1280, 720)]
+# Số ảnh nguồn cho các kịch bản ảnh -> GIF/video
+FULL_IMAGE_COUNTS = [10, 40]
+QUICK_IMAGE_COUNTS = [6]
+# (số khung, GOP) của video tổng hợp
+FULL_VIDEO_SHAPES = [(300, 12), (300, 250), (1200, 30)]
+QUICK_VIDEO_SHAPES = [(90, 12), (90, 250)]
+VIDEO_FPS = 30
+TRANSITION_FRAMES = 12
+
+
+# ---------------- Dữ liệu tổng hợp ----------------
+def synthetic_frame(w, h, i):
+    """Khung RGB có gradient, một hình chữ nhật di chuyển và chút nhiễu, thay đổi theo i."""
+    x = np.linspace(0, 255, w, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    frame = np.empty((h, w, 3), dtype=np.uint8)
+    frame[..., 0] = (x * 0.7 + i * 5) % 256
+    frame[..., 1] = (y * 0.7 + i * 3) % 256
+    frame[..., 2] = ((x + y) * 0.3 + i * 7) % 256
+    bw, bh = max(1, w // 6), max(1, h // 6)
+    bx = (i * w // 40) % max(1, w - bw)
+    by = (i * h // 60) % max(1, h - bh)
+    frame[by:by + bh, bx:bx + bw] = (255 - i * 9 % 256, 40, 200)
+    noise = np.random.default_rng(i).integers(0, 12, size=(h, w, 1), dtype=np.uint8)
+    frame += noise
+    return frame
+
+
+def synthetic_images(w, h, count):
+    from PIL import Image
+    return [Image.fromarray(synthetic_frame(w, h, i * 7)) for i in range(count)]
+
+
+def synthetic_video(data_dir, w, h, frames, gop, fps=VIDEO_FPS):
+    """Ghi (hoặc dùng lại) video H.264 tổng hợp với GOP cố định."""
+    from imageio import v2 as imageio
+    path = os.path.join(data_dir, f"synthetic_{w}x{h}_{frames}f_gop{gop}.mp4")
+    if os.path.exists(path):
+        return path
+    tmp = path + ".tmp.mp4"
+    writer = imageio.get_writer(tmp, fps=fps, codec="libx264", macro_block_size=16,
+                                output_params=["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"])
+    try:
+        for i in range(frames):
+            writer.append_data(synthetic_frame(w, h, i))
+    finally:
+        writer.close()
+    os.replace(tmp, path)
+    return path
+
+
+# ---------------- Kịch bản ----------------
+def _gif_scenario(w, h, count, effect, options):
+    def run(data_dir):
+        from animator import create_gif
+        images = synthetic_images(w, h, count)
+        start = time.perf_counter()
+        buffer, stats = create_gif(images, fps=10, effect=effect, inter_frames=4, stats=True, **options)
+        return time.perf_counter() - start, count + (count - 1) * 4, len(buffer.getvalue()), stats
+    return run
+
+
+def _video_scenario(w, h, count, effect):
+    def run(data_dir):
+        from animator import create_video
+        images = synthetic_images(w, h, count)
+        out = os.path.join(data_dir, f"bench_{os.getpid()}.mp4")
+        start = time.perf_counter()
+        _, stats = create_video(images, fps=30, effect=effect, inter_frames=4, output_path=out, stats=True)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(out)
+        os.remove(out)
+        return elapsed, count + (count - 1) * 4, size, stats
+    return run
+
+
+def _transition_scenario(w, h, effect):
+    def run(data_dir):
+        from animator import _make_fade_frames, _make_slide_frames
+        a, b = synthetic_images(w, h, 2)
+        make = _make_fade_frames if effect == "fade" else _make_slide_frames
+        start = time.perf_counter()
+        frames = make(a, b, TRANSITION_FRAMES)
+        return time.perf_counter() - start, len(frames), 0, None
+    return run
+
+
+def _extract_scenario(w, h, frames, gop, workers, image_format):
+    def run(data_dir):
+        from animator import extract_frames_from_video
+        from videoindex import get_index
+        import shutil
+        video = synthetic_video(data_dir, w, h, frames, gop)
+        get_index(video)
+        out = tempfile.mkdtemp(dir=data_dir)
+        try:
+            start = time.perf_counter()
+            info, stats = extract_frames_from_video(video, 10, 1e9, out, workers=workers, image_format=image_format,
+                                                    stats=True)
+            elapsed = time.perf_counter() - start
+            size = sum(os.path.getsize(p) for p in info["saved_paths"])
+            return elapsed, len(info["saved_paths"]), size, stats
+        finally:
+            shutil.rmtree(out, ignore_errors=True)
+    return run
+
+
+def _video_gif_scenario(w, h, frames, gop):
+    def run(data_dir):
+        from animator import create_gif_from_video
+        from videoindex import get_index
+        video = synthetic_video(data_dir, w, h, frames, gop)
+        get_index(video)
+        duration = frames / VIDEO_FPS
+        start = time.perf_counter()
+        buffer, stats = create_gif_from_video(video, 0, duration, fps=10, max_duration=duration, max_size=(640, 360),
+                                              stats=True)
+        return time.perf_counter() - start, int(duration * 10), len(buffer.getvalue()), stats
+    return run
+
+
+def build_scenarios(quick=False):
+    """Danh sách (tên, hàm chạy) của mọi kịch bản."""
+    resolutions = QUICK_RESOLUTIONS if quick else FULL_RESOLUTIONS
+    counts = QUICK_IMAGE_COUNTS if quick else FULL_IMAGE_COUNTS
+    shapes = QUICK_VIDEO_SHAPES if quick else FULL_VIDEO_SHAPES
+    scenarios = []
+    for w, h in resolutions:
+        for effect in ("fade", "slide"):
+            scenarios.append((f"transition/{effect}/{w}x{h}", _transition_scenario(w, h, effect)))
+        for count in counts:
+            for effect in ("none", "fade", "slide"):
+                scenarios.append((f"gif/{effect}/{w}x{h}/{count}img", _gif_scenario(w, h, count, effect, {})))
+            scenarios.append((f"gif/fade-global-delta/{w}x{h}/{count}img",
+                              _gif_scenario(w, h, count, "fade", {"palette": "global", "delta": True})))
+            scenarios.append((f"video/fade/{w}x{h}/{count}img", _video_scenario(w, h, count, "fade")))
+        for frames, gop in shapes:
+            for workers in (1, None):
+                name = f"extract/{w}x{h}/{frames}f/gop{gop}/{'serial' if workers == 1 else 'parallel'}"
+                scenarios.append((name, _extract_scenario(w, h, frames, gop, workers, "jpg")))
+            scenarios.append((f"video-gif/{w}x{h}/{frames}f/gop{gop}", _video_gif_scenario(w, h, frames, gop)))
+    return scenarios
+
+
+# ---------------- Đo ----------------
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOS trả byte, Linux trả KiB
+    return round(max(own, children) / scale, 1)
+
+
+def _run_in_child(quick, name, data_dir):
+    run = dict(build_scenarios(quick))[name]
+    elapsed, frames, output_bytes, stats = run(data_dir)
+    return {
+        "wall_s": round(elapsed, 4),
+        "frames": frames,
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else None,
+        "output_bytes": output_bytes,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": stats.as_dict()["stages"] if stats else None,
+    }
+
+
+def run_benchmarks(quick=False, only=None, repeat=1, data_dir=None, log=print):
+    """Chạy các kịch bản (lọc theo chuỗi con only), mỗi kịch bản repeat lần, lấy lần nhanh nhất."""
+    from cachefiles import CACHE_ROOT_ENV
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "pythondetai_bench")
+    os.makedirs(data_dir, exist_ok=True)
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name, _ in build_scenarios(quick):
+        if only and not any(s in name for s in only):
+            continue
+        best = None
+        for _ in range(repeat):
+            # mỗi lần chạy một thư mục cache đĩa trống (process con và các worker của nó kế thừa
+            # biến môi trường), để kết quả không phụ thuộc chỉ mục/thumbnail còn lại từ lần chạy trước
+            previous = os.environ.get(CACHE_ROOT_ENV)
+            with tempfile.TemporaryDirectory(prefix="cache-", dir=data_dir) as cache_root:
+                os.environ[CACHE_ROOT_ENV] = cache_root
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        result = pool.submit(_run_in_child, quick, name, data_dir).result()
+                finally:
+                    if previous is None:
+                        del os.environ[CACHE_ROOT_ENV]
+                    else:
+                        os.environ[CACHE_ROOT_ENV] = previous
+            if best is None or result["wall_s"] < best["wall_s"]:
+                best = result
+        results[name] = best
+        log(f"{name:55s} {best['wall_s']:8.3f}s {best['fps'] or 0:9.1f} khung/s  RSS {best['peak_rss_mb']} MB")
+    return results
+
+
+def _environment():
+    import cv2
+    import PIL
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, threshold=0.10, min_delta=0.01):
+    """
+    Các kịch bản chậm hơn baseline quá threshold (tỉ lệ) và quá min_delta giây
+    (tránh báo nhầm với kịch bản chỉ mất vài mili giây): [(tên, thời gian cũ, thời gian mới)].
+    """
+    slower = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if old and old.get("wall_s") and new["wall_s"] > old["wall_s"] * (1 + threshold) \
+                and new["wall_s"] - old["wall_s"] > min_delta:
+            slower.append((name, old["wall_s"], new["wall_s"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark animator trên dữ liệu tổng hợp.")
+    parser.add_argument("--quick", action="store_true", help="bộ kịch bản nhỏ, chạy nhanh")
+    parser.add_argument("--only", action="append", help="chỉ chạy kịch bản có tên chứa chuỗi này (lặp được)")
+    parser.add_argument("--repeat", type=int, default=1, help="số lần chạy mỗi kịch bản, lấy lần nhanh nhất")
+    parser.add_argument("--data-dir", help="thư mục lưu video tổng hợp (dùng lại giữa các lần chạy)")
+    parser.add_argument("--out", default="benchmark_results.json", help="file JSON kết quả")
+    parser.add_argument("--compare", help="file JSON của lần chạy trước để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.10, help="ngưỡng chậm hơn bị coi là hồi quy (0.10 = 10%%)")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="chênh lệch tối thiểu (giây) để tính là chậm hơn")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.quick, args.only, max(1, args.repeat), args.data_dir)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"environment": _environment(), "quick": args.quick, "results": results}, f,
+                  indent=2, ensure_ascii=False)
+    print(f"Đã lưu kết quả vào {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        slower = compare(results, baseline, args.threshold, args.min_delta)
+        for name, old, new in slower:
+            print(f"CHẬM HƠN: {name}: {old:.3f}s -> {new:.3f}s")
+        if slower:
+            return 1
+        print("Không có kịch bản nào chậm hơn ngưỡng.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
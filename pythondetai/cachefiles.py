@@ -0,0 +1,50 @@
+# cachefiles.py
+from contextlib import contextmanager
+import hashlib
+import os
+import threading
+
+# Thư mục gốc của mọi cache đĩa (thumbnail, chỉ mục video, ...), mỗi loại một thư mục con;
+# biến môi trường CACHE_ROOT_ENV đổi được thư mục này (kể cả cho các process con, vd. benchmark)
+CACHE_ROOT_ENV = "PYTHONDETAI_CACHE"
+
+
+def cache_dir(name):
+    """Thư mục cache đĩa mặc định của loại name, vd. cache_dir("thumbnails")."""
+    root = os.environ.get(CACHE_ROOT_ENV) or os.path.join(os.path.expanduser("~"), ".cache", "pythondetai")
+    return os.path.join(root, name)
+
+
+def stat_key(path):
+    """Khóa của file theo (đường dẫn tuyệt đối, mtime, kích thước): file bị sửa thì khóa đổi."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def hashed_name(key, ext=""):
+    """Tên file ngắn, cố định cho một khóa bất kỳ (tuple, chuỗi, ...) để lưu trong thư mục cache."""
+    return hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest() + ext
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Đường dẫn tạm cạnh path (cùng phần mở rộng, để thư viện ghi nhận đúng định dạng) cho khối with;
+    xong thì đổi tên thành path, lỗi hoặc bị hủy thì xóa file tạm. Người đọc path không bao giờ
+    thấy file ghi dở, và nhiều luồng/process cùng ghi một path không giẫm lên nhau.
+    """
+    root, ext = os.path.splitext(os.fspath(path))
+    tmp_path = f"{root}.partial-{os.getpid()}-{threading.get_ident()}{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
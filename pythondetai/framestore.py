@@ -0,0 +1,111 @@
+# framestore.py
+import tempfile
+
+import numpy as np
+
+# Vượt quá chừng này byte thì các khung được chuyển xuống file tạm trên đĩa (numpy.memmap)
+DEFAULT_SPILL_BYTES = 256 * 1024 * 1024
+
+
+class FrameStore:
+    """
+    Dãy khung uint8 cùng kích thước, lưu liền trong một mảng (N,H,W,3) (hoặc (N,)+frame_shape bất kỳ).
+    Khi tổng dung lượng vượt spill_bytes, mảng được chuyển sang numpy.memmap trên một file tạm
+    (trong directory, mặc định thư mục tạm của hệ thống; file tự xóa khi đóng) nên độ dài chuỗi
+    khung không còn bị giới hạn bởi RAM. spill_bytes=None: luôn giữ trong RAM; 0: luôn dùng đĩa.
+    store[i] và các phép lặp trả về view vào mảng, không sao chép; không sửa view sau khi đã ghi.
+    capacity: số khung dự kiến, cấp phát trước một lần.
+    """
+
+    def __init__(self, frame_shape, spill_bytes=DEFAULT_SPILL_BYTES, directory=None, capacity=0):
+        self.frame_shape = tuple(int(x) for x in frame_shape)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        self.spill_bytes = spill_bytes
+        self.directory = directory
+        self._data = np.empty((0,) + self.frame_shape, dtype=np.uint8)
+        self._length = 0
+        self._file = None
+        if capacity:
+            self._reserve(capacity)
+
+    @property
+    def spilled(self):
+        """True nếu các khung đang nằm trên đĩa."""
+        return self._file is not None
+
+    @property
+    def nbytes(self):
+        return self._length * self.frame_bytes
+
+    def _open_map(self, capacity):
+        # memmap ở chế độ r+ tự nới file tới đủ kích thước (file thưa, chưa tốn chỗ trên đĩa)
+        return np.memmap(self._file, dtype=np.uint8, mode="r+", shape=(capacity,) + self.frame_shape)
+
+    def _reserve(self, count):
+        need = self._length + count
+        capacity = len(self._data)
+        if need <= capacity:
+            return
+        grown = max(need, capacity * 2, 4)
+        if self._file is None:
+            limit = self.spill_bytes
+            if limit is None or need * self.frame_bytes <= limit:
+                if limit is not None:
+                    grown = max(need, min(grown, limit // self.frame_bytes))  # không vượt ngưỡng chỉ vì nhân đôi
+                data = np.empty((grown,) + self.frame_shape, dtype=np.uint8)
+                data[:self._length] = self._data[:self._length]
+                self._data = data
+                return
+            # vượt ngưỡng: chuyển các khung đã có xuống file tạm, từ đây chỉ nới file
+            self._file = tempfile.TemporaryFile(prefix="frames-", dir=self.directory)
+            data = self._open_map(grown)
+            data[:self._length] = self._data[:self._length]
+            self._data = data
+            return
+        self._data.flush()
+        self._data = self._open_map(grown)
+
+    def append(self, frame):
+        """Thêm một khung (mảng hoặc ảnh PIL cùng kích thước); trả về chỉ số của nó."""
+        frame = np.asarray(frame)
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Khung có kích thước {frame.shape}, cần {self.frame_shape}.")
+        self._reserve(1)
+        self._data[self._length] = frame
+        self._length += 1
+        return self._length - 1
+
+    def allocate(self, count):
+        """
+        Thêm count khung chưa có dữ liệu vào cuối và trả về view (count,H,W,3) để ghi thẳng vào,
+        vd. làm tham số out của phép tính theo lô.
+        """
+        self._reserve(count)
+        start = self._length
+        self._length += count
+        return self._data[start:self._length]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        return self._data[:self._length][index]
+
+    def __iter__(self):
+        data = self._data[:self._length]
+        for i in range(len(data)):
+            yield data[i]
+
+    def close(self):
+        """Giải phóng mảng và xóa file tạm (view đã lấy ra vẫn dùng được tới khi bị thu hồi)."""
+        self._data = np.empty((0,) + self.frame_shape, dtype=np.uint8)
+        self._length = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
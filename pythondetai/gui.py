@@ -1,15 +1,21 @@
 # gui.py
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk ,font
-from PIL import Image as PILImage, ImageTk, Image
-from processor import load_images
-from animator import create_gif, create_video, extract_frames_from_video
+from PIL import ImageTk, Image
+from processor import iter_images
+from animator import create_video, create_gif_from_video, extract_frames_from_video, preview_frames
+from rendercache import render_gif
+from scheduler import JobScheduler
+from player import FramePlayer, VideoPlayer, gif_file_frames
+from thumbnails import thumbnail_service
+from resizer import fit_size, resize_image
 import cv2
-import threading
-import time
 import os
 
 MAX_EXTRACT_SECONDS = 15.0
+MAX_GIF_SIZE = (960, 540)  # khung GIF từ video được thu nhỏ ngay khi giải mã để vừa kích thước này
+WARM_MAX_BYTES = 32 * 1024 * 1024  # chỉ render sẵn GIF sau xem trước khi tổng dung lượng ảnh không quá mức này
+USER_JOBS = ("gif_save", "video", "video_gif", "extract")  # job do người dùng bấm, render sẵn phải nhường
 
 class GifApp:
     def __init__(self):
@@ -19,6 +25,9 @@ class GifApp:
         self.root.geometry("1200x760")
         self.root.config(bg="#f7f7f7")
 
+        # Các tác vụ nặng chạy nền, kết quả trả về luồng Tk qua root.after
+        self.jobs = JobScheduler(self.root)
+
         self.last_created_gif_path = None
 
         # tăng kích thước chữ
@@ -29,14 +38,13 @@ class GifApp:
 
         # Shared
         self.image_paths = []
-        self.gif_frames = []
-        self.gif_index = 0
+        self.gif_player = None  # FramePlayer của GIF xem trước (chỉ giữ một cửa sổ khung)
+        self._warmed_player = None  # bản xem trước đã được render sẵn vào render cache
+        self.gif_from_video_player = None
         self.playing = False
 
         # Video preview variables
-        self.video_running = False
-        self.video_paused = False
-        self.video_thread = None
+        self.video_player = None
         self.video_path = None
 
         # Extract tab variables
@@ -54,8 +62,9 @@ class GifApp:
 
         try:
             # Tạo thumbnail của GIF để hiển thị trong tab2
-            gif_img = Image.open(self.last_created_gif_path)
-            gif_img.thumbnail((200, 150))  # Kích thước nhỏ cho tab2
+            with Image.open(self.last_created_gif_path) as gif_img:
+                gif_img = gif_img.convert("RGBA")
+            gif_img = resize_image(gif_img, fit_size(gif_img.size, (200, 150)))  # Kích thước nhỏ cho tab2
 
             # Chuyển sang PhotoImage
             gif_photo = ImageTk.PhotoImage(gif_img)
@@ -82,6 +91,13 @@ class GifApp:
 
 
     def create_widgets(self):
+        # Thanh trạng thái: tiến độ tác vụ nền + nút hủy
+        status_frame = tk.Frame(self.root, bg="#eaeaea")
+        status_frame.pack(side="bottom", fill="x")
+        self.status_label = tk.Label(status_frame, text="", bg="#eaeaea", anchor="w")
+        self.status_label.pack(side="left", fill="x", expand=True, padx=10)
+        tk.Button(status_frame, text="⛔ Hủy", command=self.cancel_jobs, width=8).pack(side="right", padx=6, pady=2)
+
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -213,98 +229,93 @@ class GifApp:
     def show_previews(self):
         for w in self.thumb_frame.winfo_children():
             w.destroy()
-        for idx, path in enumerate(self.image_paths):
-            try:
-                img = Image.open(path)
-                img.thumbnail((120,120))
-                tkimg = ImageTk.PhotoImage(img)
-                lbl = tk.Label(self.thumb_frame, image=tkimg, bg="#fff")
-                lbl.image = tkimg
-                lbl.grid(row=0, column=idx, padx=6, pady=6)
-            except Exception as e:
-                print("Lỗi mở ảnh:", path, e)
-        self.thumb_frame.update_idletasks()
-        self.preview_canvas.configure(scrollregion=self.preview_canvas.bbox("all"))
+        self._load_thumbnails("thumbs", list(self.image_paths), (120, 120), self.thumb_frame, 0, "Lỗi mở ảnh:")
+
+    def _load_thumbnails(self, key, paths, size, frame, start_col, error_text):
+        """Tạo thumbnail nền (song song, có cache đĩa) và lấp dần vào frame khi từng ảnh xong."""
+        def place(idx, img):
+            tkimg = ImageTk.PhotoImage(img)
+            lbl = tk.Label(frame, image=tkimg, bg="#fff")
+            lbl.image = tkimg
+            lbl.grid(row=0, column=start_col + idx, padx=6, pady=6)
+
+        def load(job):
+            results = job.track(thumbnail_service.iter_thumbnails(paths, size), total=len(paths),
+                                message="Đang tạo thumbnail")
+            for idx, path, img, error in results:
+                if error is not None:
+                    print(error_text, path, error)
+                else:
+                    job.post(place, idx, img)
+
+        self.jobs.submit(key, load, on_done=lambda _: self.status_label.config(text=""),
+                         on_error=lambda e: self._show_job_error("Lỗi tạo thumbnail", e),
+                         on_progress=self._show_progress, background=True)
+
+    # ----------------- Background jobs -----------------
+    def _show_progress(self, done, total, message=None):
+        text = message or "Đang xử lý"
+        if total:
+            text += f"... {min(100, int(done * 100 / total))}%"
+        self.status_label.config(text=text)
+
+    def _show_job_error(self, title, error):
+        self.status_label.config(text="")
+        messagebox.showerror(title, str(error))
+
+    def cancel_jobs(self):
+        self.jobs.cancel()
+        self.status_label.config(text="Đã hủy.")
+
+    def _gif_params(self):
+        """Đọc tham số GIF từ các biến Tk (chỉ gọi trên luồng Tk)."""
+        return dict(fps=self.fps_var.get(), effect=self.effect_var.get(), inter_frames=self.inter_var.get())
 
     def preview_gif(self):
-        import io
-        from PIL import Image, ImageTk
-
         if not self.image_paths:
             messagebox.showwarning("Chưa chọn ảnh", "Vui lòng chọn ít nhất 1 ảnh.")
             return
 
-        # --- Tạo GIF trong bộ nhớ ---
-        try:
-            images = load_images(self.image_paths)
-            gif_buffer = create_gif(
-                images,
-                fps=self.fps_var.get(),
-                effect=self.effect_var.get(),
-                inter_frames=self.inter_var.get()
-            )
-        except Exception as e:
-            messagebox.showerror("Lỗi tạo GIF", f"Lỗi: {e}")
-            return
-
-        gif_buffer.seek(0)
-        gif = Image.open(io.BytesIO(gif_buffer.read()))
+        paths = list(self.image_paths)
+        params = self._gif_params()
 
-        # --- Đọc các frame GIF ---
-        frames = []
-        try:
-            while True:
-                frame = gif.copy().convert("RGBA")
-                frame.thumbnail((560, 420))  # vừa canvas hiện có
-                frames.append(ImageTk.PhotoImage(frame))
-                gif.seek(gif.tell() + 1)
-        except EOFError:
-            pass
-
-        if not frames:
-            messagebox.showwarning("Không có frame", "Không thể hiển thị GIF.")
-            return
+        # --- Sinh khung xem trước ở kích thước canvas trên thread giải mã của player;
+        #     canvas phát ngay khi có khung đầu tiên và chỉ giữ vài khung quanh đầu phát ---
+        def source():
+            return preview_frames(iter_images(paths), (560, 420), effect=params["effect"],
+                                  inter_frames=params["inter_frames"])
 
-        # --- Phát GIF lên canvas hiện có ---
-        self.gif_frames = frames
-        self.gif_index = 0
+        self.stop_gif_animation()
+        self.gif_player = FramePlayer(self.root, self.gif_canvas, source, (280, 210),  # center canvas 560x420
+                                      delay_ms=lambda: max(50, int(1000 / max(1, self.fps_var.get()))),
+                                      on_error=lambda e: messagebox.showerror("Lỗi tạo GIF", f"Lỗi: {e}"),
+                                      on_pass_end=lambda: self._warm_gif_cache(player, paths, params))
+        player = self.gif_player
         self.playing = True
-
-        def draw_frame():
-            if not self.playing or not self.gif_frames:
+        self.gif_player.play()
+
+    def _warm_gif_cache(self, player, paths, params):
+        """
+        Render sẵn GIF chuẩn vào render cache trên pool nền (cùng khóa với save_gif), để bấm
+        "Lưu GIF" ngay sau khi xem trước chỉ còn việc ghi file. Chỉ chạy một lần, sau khi bản xem
+        trước đã phát hết một vòng, khi không có job nào của người dùng đang chạy và bộ ảnh đủ nhỏ;
+        còn lại thì để save_gif tự render.
+        """
+        if player is not self.gif_player or player is self._warmed_player:
+            return
+        self._warmed_player = player
+        if any(self.jobs.is_running(key) for key in USER_JOBS):
+            return
+        try:
+            if sum(os.path.getsize(p) for p in paths) > WARM_MAX_BYTES:
                 return
-            frame = self.gif_frames[self.gif_index]
-            self.gif_canvas.delete("all")
-            self.gif_canvas.create_image(280, 210, image=frame)  # center canvas 560x420
-            self.gif_canvas.image = frame
-            self.gif_index = (self.gif_index + 1) % len(self.gif_frames)
-            delay = max(50, int(1000 / max(1, self.fps_var.get())))
-            self.root.after(delay, draw_frame)
-
-        draw_frame()
-
-    def _draw_gif_frame(self):
-        if not self.playing or not self.gif_frames:
+        except OSError:
             return
 
-        frame = self.gif_frames[self.gif_index]
-        self.gif_canvas.delete("all")
-        self.gif_canvas.create_image(280, 210, image=frame)
-        self.gif_canvas.image = frame  # tránh bị GC xoá
-
-        self.gif_index = (self.gif_index + 1) % len(self.gif_frames)
-        delay = max(50, int(1000 / max(1, self.fps_var.get())))
-        self.root.after(delay, self._draw_gif_frame)
+        def warm(job):
+            render_gif(paths, images=job.track(iter_images(paths)), palette='global', delta=True, **params)
 
-    def _play_gif_loop(self):
-        if not self.playing or not getattr(self, "gif_frames", None):
-            return
-        frame = self.gif_frames[self.gif_index]
-        self.gif_canvas.config(image=frame)
-        self.gif_canvas.image = frame
-        self.gif_index = (self.gif_index + 1) % len(self.gif_frames)
-        delay = max(50, int(1000 / max(1, self.fps_var.get())))
-        self.root.after(delay, self._play_gif_loop)
+        self.jobs.submit("gif_warm", warm, background=True)
 
     def save_gif(self):
         if not self.image_paths:
@@ -313,14 +324,27 @@ class GifApp:
         save_path = filedialog.asksaveasfilename(defaultextension=".gif", filetypes=[("GIF files", "*.gif")])
         if not save_path:
             return
-        images = load_images(self.image_paths)
-        try:
-            gif_buffer = create_gif(images, fps=self.fps_var.get(), effect=self.effect_var.get(), inter_frames=self.inter_var.get())
+
+        paths = list(self.image_paths)
+        params = self._gif_params()
+        self.jobs.cancel("gif_warm")  # job lưu tự render nếu cache chưa có, không chạy trùng
+
+        def render(job):
+            # Nếu đã render với cùng ảnh và tham số thì render cache trả lại ngay, chỉ còn việc ghi file
+            images = job.track(iter_images(paths), total=len(paths), message="Đang tạo GIF")
+            gif_bytes = render_gif(paths, images=images, palette='global', delta=True, **params)
+            job.check()
             with open(save_path, "wb") as f:
-                f.write(gif_buffer.getvalue())
-            messagebox.showinfo("Thành công", f"Đã lưu GIF tại:\n{save_path}")
-        except Exception as e:
-            messagebox.showerror("Lỗi lưu GIF", str(e))
+                f.write(gif_bytes)
+            return save_path
+
+        def done(path):
+            self.status_label.config(text="")
+            messagebox.showinfo("Thành công", f"Đã lưu GIF tại:\n{path}")
+
+        self.jobs.submit("gif_save", render, on_done=done,
+                         on_error=lambda e: self._show_job_error("Lỗi lưu GIF", e),
+                         on_progress=self._show_progress)
     #xem trước video và tạo ra video đồng thời
     from tkinter import filedialog, messagebox
 
@@ -340,28 +364,25 @@ class GifApp:
         if not save_path:
             return
 
-        images = load_images(self.image_paths)
         self.video_path = save_path
+        paths = list(self.image_paths)
+        params = self._gif_params()
 
-        try:
-            # 🔹 Tạo video
-            create_video(
-                images,
-                fps=self.fps_var.get(),
-                effect=self.effect_var.get(),
-                inter_frames=self.inter_var.get(),
-                output_path=self.video_path
-            )
+        def render(job):
+            # 🔹 Tạo video (ảnh được đọc dần theo pipeline, không nạp hết vào RAM)
+            images = job.track(iter_images(paths), total=len(paths), message="Đang tạo video")
+            return create_video(images, output_path=save_path, **params)
 
+        def done(path):
+            self.status_label.config(text="")
             # 🔹 Thông báo sau khi tạo xong
-            messagebox.showinfo("Thành công", f"🎬 Video đã được lưu tại:\n{self.video_path}")
+            messagebox.showinfo("Thành công", f"🎬 Video đã được lưu tại:\n{path}")
+            # 🔹 Mở cửa sổ preview video riêng
+            self.open_video_window(path)
 
-        except Exception as e:
-            messagebox.showerror("Lỗi tạo video", str(e))
-            return
-
-        # 🔹 Mở cửa sổ preview video riêng
-        self.open_video_window(self.video_path)
+        self.jobs.submit("video", render, on_done=done,
+                         on_error=lambda e: self._show_job_error("Lỗi tạo video", e),
+                         on_progress=self._show_progress)
 
     def open_video_window(self, video_path):
         if not os.path.exists(video_path):
@@ -379,32 +400,31 @@ class GifApp:
         controls = tk.Frame(win, bg="#333")
         controls.pack(fill="x", pady=10)
 
-        # Biến điều khiển video
-        cap = cv2.VideoCapture(video_path)
-        paused = False
-        running = True
+        # Biến điều khiển video: giải mã trên thread riêng, trình chiếu theo đồng hồ thật
+        try:
+            player = VideoPlayer(win, video_label, video_path, (760, 540))
+        except ValueError as e:
+            win.destroy()
+            messagebox.showerror("Lỗi", str(e))
+            return
         speed_factor = 1.0  # tốc độ mặc định (1x)
 
         # Nhãn hiển thị tốc độ
         speed_label = tk.Label(controls, text="Tốc độ: 1.0x", bg="#333", fg="white", width=12)
         speed_label.pack(side="right", padx=10)
 
-
         def update_speed_label():
             speed_label.config(text=f"Tốc độ: {speed_factor:.1f}x")
+            player.set_speed(speed_factor)
 
         def play_video():
-            nonlocal paused
-            paused = False
+            player.play()
 
         def pause_video():
-            nonlocal paused
-            paused = True
+            player.pause()
 
         def skip_video():
-            nonlocal cap
-            pos = cap.get(cv2.CAP_PROP_POS_MSEC)
-            cap.set(cv2.CAP_PROP_POS_MSEC, pos + 5000)
+            player.skip(5)
 
         def toggle_fullscreen():
             win.attributes("-fullscreen", not win.attributes("-fullscreen"))
@@ -429,60 +449,41 @@ class GifApp:
         tk.Button(controls, text="⏩ 2x", width=8, command=increase_speed).pack(side="left", padx=5)
         tk.Button(controls, text="🔍 Phóng to", width=10, command=toggle_fullscreen).pack(side="right", padx=5)
 
-        def update_frame():
-            nonlocal running
-            if not running:
-                return
-            if not paused:
-                ret, frame = cap.read()
-                if not ret:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # lặp lại
-                    ret, frame = cap.read()
-                if ret:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    img = Image.fromarray(frame)
-                    img.thumbnail((760, 540))
-                    imgtk = ImageTk.PhotoImage(img)
-                    video_label.config(image=imgtk)
-                    video_label.image = imgtk
-
-            # Thay đổi tốc độ bằng cách điều chỉnh khoảng delay giữa các frame
-            delay = int(30 / speed_factor)  # 30ms là khoảng ~33fps
-            win.after(max(1, delay), update_frame)
-
         def on_close():
-            nonlocal running
-            running = False
-            cap.release()
+            player.stop()
             win.destroy()
 
         win.protocol("WM_DELETE_WINDOW", on_close)
-        update_frame()
+        player.play()
 
     def open_video_to_gif_dialog(self):
         def on_seek(event):
-            nonlocal cap, paused
-            if cap:
-                pos = progress_var.get()
-                cap.set(cv2.CAP_PROP_POS_MSEC, pos * 1000)
-                ret, frame = cap.read()
-                if ret:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    img = Image.fromarray(frame)
-                    img.thumbnail((850, 480))
-                    imgtk = ImageTk.PhotoImage(img)
-                    video_label.config(image=imgtk)
-                    video_label.image = imgtk
+            # Đang kéo: chỉ hiện khung thu nhỏ trong filmstrip, không giải mã video
+            pos = progress_var.get()
+            time_label.config(text=f"{format_time(pos)} / {format_time(duration)}")
+            tile = filmstrip.tile_at(pos) if filmstrip else None
+            if tile is not None:
+                tile = resize_image(tile, fit_size(tile.size, (850, 480), upscale=True))
+                imgtk = ImageTk.PhotoImage(tile)
+                video_label.config(image=imgtk)
+                video_label.image = imgtk
+
         def on_drag_start(event):
-            nonlocal user_dragging
+            nonlocal user_dragging, resume_after_drag
             user_dragging = True
+            resume_after_drag = bool(player and player.playing)
+            if player:
+                player.pause()
 
         def on_drag_end(event):
             nonlocal user_dragging
             user_dragging = False
             pos = progress_var.get()
-            if cap:
-                cap.set(cv2.CAP_PROP_POS_MSEC, pos * 1000)
+            if player:
+                player.seek(pos)  # thả chuột mới giải mã khung đầy đủ
+                if resume_after_drag:
+                    player.play()
+
 
         def format_time(seconds):
             m, s = divmod(int(seconds), 60)
@@ -490,6 +491,8 @@ class GifApp:
 
         def update_speed_label():
             speed_label.config(text=f"Tốc độ: {speed_factor:.2f}x")
+            if player:
+                player.set_speed(speed_factor)
 
         dialog = tk.Toplevel(self.root)
         dialog.title("🎥 Tạo GIF từ Video")
@@ -595,27 +598,31 @@ class GifApp:
         tk.Button(scrollable_frame, text="🎞️ Tạo GIF", width=14, command=lambda: create_gif_from_video()).pack(pady=8)
 
         # --- Các biến video ---
-        cap = None
-        running = False
+        player = None
+        filmstrip = None  # khung thu nhỏ để xem trước khi kéo thanh thời gian
+        video_path = None
         duration = 0
         user_dragging = False
-        paused = False
-        current_pos = 0  # 🔹 thêm biến này để lưu thời điểm hiện tại (giây)
+        resume_after_drag = False
         speed_factor = 1.0  # tốc độ mặc định (1x)
 
         def select_video():
-            nonlocal cap, running, duration
+            nonlocal player, video_path, duration
             path = filedialog.askopenfilename(title="Chọn video", filetypes=[("Video", "*.mp4 *.avi *.mov *.mkv")])
             if not path:
                 return
             video_path_var.set(os.path.basename(path))
-            cap = cv2.VideoCapture(path)
-            if not cap.isOpened():
+            if player:
+                player.stop()
+                player = None
+            try:
+                player = VideoPlayer(dialog, video_label, path, (850, 480), on_position=update_position)
+            except ValueError:
                 messagebox.showerror("Lỗi", "Không mở được video.")
                 return
-            fps = cap.get(cv2.CAP_PROP_FPS) or 60
-            frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-            duration = frame_count / fps
+            video_path = path
+            player.set_speed(speed_factor)
+            duration = player.duration
 
             progress_scale.config(to=duration)
 
@@ -623,61 +630,49 @@ class GifApp:
             end_scale.config(to=duration)
             end_scale.set(min(5, duration))
 
-            running = True
-            update_video()
+            player.play()
+            build_filmstrip(path, duration)
 
-        def update_video():
-            nonlocal cap, running, paused, current_pos, speed_factor
-            if not running or cap is None:
-                return
+        def build_filmstrip(path, duration):
+            nonlocal filmstrip
+            filmstrip = None
 
-            # 🔸 Nếu đang tạm dừng thì chỉ chờ, không đọc frame
-            if paused:
-                dialog.after(100, update_video)
-                return
+            def build(job):
+                def on_tile(strip, done, total):
+                    nonlocal filmstrip
+                    job.report(done, total, "Đang tạo filmstrip")  # ném JobCancelled nếu đã đổi video
+                    filmstrip = strip  # dùng được ngay những khung đã tạo
+                thumbnail_service.filmstrip(path, duration, on_tile=on_tile)
 
-            ret, frame = cap.read()
-            if not ret:
-                # 🔹 Nếu hết video thật sự thì tua về đầu
-                if current_pos >= duration:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    current_pos = 0
-                # Tính delay theo tốc độ hiện tại
-                delay = int(40 / speed_factor)
-                dialog.after(delay, update_video)
-                return
-
-            if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame)
-                img.thumbnail((850, 480))
-                imgtk = ImageTk.PhotoImage(img)
-                video_label.config(image=imgtk)
-                video_label.image = imgtk
+            self.jobs.submit("filmstrip", build, on_done=lambda _: self.status_label.config(text=""),
+                             on_error=lambda e: self._show_job_error("Lỗi tạo filmstrip", e),
+                             on_progress=self._show_progress, background=True)
 
+        def update_position(current_time):
             # 🔹 Cập nhật vị trí phát
-            progress_var.set(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
-            current_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if not user_dragging:
+                progress_var.set(current_time)
             time_label.config(text=f"{format_time(current_time)} / {format_time(duration)}")
 
-            # 🔹 Delay thay đổi theo tốc độ
-            delay = int(20 /   speed_factor)  #
-            dialog.after(delay, update_video)
-
-            if not user_dragging:
-                progress_var.set(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
         def play_video():
-            nonlocal paused, cap, current_pos
-            if cap:
-                cap.set(cv2.CAP_PROP_POS_MSEC, progress_var.get() * 1000)
-            paused = False
+            if player:
+                player.seek(progress_var.get())
+                player.play()
             print("Video playing from", progress_var.get(), "seconds.")
 
         def pause_video():
-            nonlocal paused
-            paused = True
+            if player:
+                player.pause()
             print("Video paused.")
 
+        def on_close():
+            if player:
+                player.stop()
+            self.jobs.cancel("filmstrip")
+            dialog.destroy()
+
+        dialog.protocol("WM_DELETE_WINDOW", on_close)
+
         def increase_speed():
             nonlocal speed_factor
             if speed_factor < 4.0:
@@ -691,8 +686,7 @@ class GifApp:
                 update_speed_label()
 
         def create_gif_from_video():
-            nonlocal cap, duration, speed_factor
-            if not cap:
+            if not player or not video_path:
                 messagebox.showwarning("Chưa chọn video", "Vui lòng chọn video trước.")
                 return
 
@@ -706,147 +700,76 @@ class GifApp:
             if not save_path:
                 return
 
-            cap.set(cv2.CAP_PROP_POS_MSEC, start_sec * 1000)
-            frames = []
-
             # fps áp dụng tốc độ
             fps = int(fps_var.get() * speed_factor)
             if fps < 1:  # đảm bảo không quá thấp
                 fps = 1
-
-            while cap.isOpened():
-                pos = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
-                if pos > end_sec:
-                    break
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame)
-                frames.append(img)
-
-                # 🔹 Tua theo tốc độ khi đọc frame (để khớp tốc độ)
-                next_frame_time = 1000 / fps  # mili giây giữa frame
-                cap.set(cv2.CAP_PROP_POS_MSEC, cap.get(cv2.CAP_PROP_POS_MSEC) + next_frame_time)
-
-            cap.release()
-
-            # Tạo GIF
-            from processor import load_images
-            from animator import create_gif
-            try:
-                gif_buffer = create_gif(frames, fps=fps, effect=self.effect_var.get(),
-                                        inter_frames=self.inter_var.get())
+            effect = self.effect_var.get()
+            inter_frames = self.inter_var.get()
+
+            def render(job):
+                # Cùng engine với animator: giải mã một lần, thu nhỏ ngay khi giải mã và ghi thẳng vào
+                # bộ mã hóa GIF; capture riêng nên không đụng tới video đang phát trong dialog
+                gif_buffer = create_gif_from_video(video_path, start_sec, end_sec, fps=fps, effect=effect,
+                                                   inter_frames=inter_frames, max_duration=MAX_EXTRACT_SECONDS,
+                                                   max_size=MAX_GIF_SIZE,
+                                                   progress=lambda done, total: job.report(done, total, "Đang tạo GIF"))
+                job.check()
                 with open(save_path, "wb") as f:
                     f.write(gif_buffer.getvalue())
 
-                self.last_created_gif_path = save_path  # Lưu đường dẫn GIF vừa tạo
+                return save_path
+
+            def done(path):
+                self.status_label.config(text="")
+                self.last_created_gif_path = path  # Lưu đường dẫn GIF vừa tạo
                 self._update_extract_tab_preview()
-                messagebox.showinfo("Thành công", f"Đã tạo GIF từ video:\n{save_path}")
-            except Exception as e:
-                messagebox.showerror("Lỗi tạo GIF", str(e))
-                return
+                messagebox.showinfo("Thành công", f"Đã tạo GIF từ video:\n{path}")
 
-            # --- Preview trực tiếp từ buffer, không resize ---
-            from io import BytesIO
-            gif_buffer.seek(0)
-            gif = PILImage.open(BytesIO(gif_buffer.getvalue()))
-            frames_preview = []
+                # --- Hiển thị trên canvas bên phải: giải mã dần từ file GIF, không resize ---
+                # mỗi khung giữ đúng thời lượng ghi trong file (khung trùng đã được gộp)
+                self.stop_gif_from_video_animation()
+                self.gif_from_video_player = FramePlayer(self.root, self.gif_from_video_canvas,
+                                                         gif_file_frames(path), (280, 200),
+                                                         delay_ms=max(50, int(1000 / fps)))
+                self.gif_from_video_player.play()
 
-            try:
-                while True:
-                    frame = gif.copy().convert("RGBA")
-                    frames_preview.append(ImageTk.PhotoImage(frame))
-                    gif.seek(gif.tell() + 1)
-            except EOFError:
-                pass
-
-            # --- Hiển thị trên canvas bên phải ---
-            if frames_preview:
-                self.gif_from_video_frames = frames_preview
-                self.gif_from_video_index = 0
-
-                def play_gif_video():
-                    if (not hasattr(self, "gif_from_video_frames") or
-                            not self.gif_from_video_frames or
-                            not self.gif_from_video_playing):
-                        return
-
-                    frame = self.gif_from_video_frames[self.gif_from_video_index]
-                    self.gif_from_video_canvas.delete("all")
-                    self.gif_from_video_canvas.create_image(280, 200, image=frame)
-                    self.gif_from_video_canvas.image = frame
-                    self.gif_from_video_index = (self.gif_from_video_index + 1) % len(self.gif_from_video_frames)
-
-                    delay = max(50, int(1000 / fps))
-                    self.root.after(delay, play_gif_video)
-
-                self.gif_from_video_playing = True
-                self.gif_from_video_frames = frames_preview
-                self.gif_from_video_index = 0
-                play_gif_video()
+            self.jobs.submit("video_gif", render, on_done=done,
+                             on_error=lambda e: self._show_job_error("Lỗi tạo GIF", e),
+                             on_progress=self._show_progress)
 
     # ----------------- Video preview (Tab1) -----------------
     def play_video(self):
         if not self.video_path or not os.path.exists(self.video_path):
             messagebox.showinfo("Chưa có video", "Hãy tạo video trước.")
             return
-        if self.video_running:
-            self.video_paused = False
-            return
-        self.video_running = True
-        self.video_paused = False
-        self.video_thread = threading.Thread(target=self._video_loop, daemon=True)
-        self.video_thread.start()
-
-    def _video_loop(self):
-        cap = cv2.VideoCapture(self.video_path)
-        if not cap.isOpened():
-            messagebox.showerror("Lỗi", "Không mở được file video.")
-            self.video_running = False
-            return
-        orig_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-        while cap.isOpened() and self.video_running:
-            if self.video_paused:
-                time.sleep(0.05)
-                continue
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame)
-            img.thumbnail((560,420))
-            imgtk = ImageTk.PhotoImage(img)
-            # update on main thread via .after
-            self.video_canvas.after(0, lambda im=imgtk: self._update_video_canvas(im))
-            # sleep according to original fps
-            time.sleep(1.0 / max(1.0, orig_fps))
-        cap.release()
-        self.video_running = False
-
-    def _update_video_canvas(self, imgtk):
-        for w in self.video_canvas.winfo_children():
-            w.destroy()
-            # Hiển thị khung hình video
-        self.video_canvas.config(image=imgtk)
-        self.video_canvas.image = imgtk
+        if self.video_player is None:
+            try:
+                self.video_player = VideoPlayer(self.root, self.video_canvas, self.video_path, (560, 420),
+                                                loop=False, on_end=self._stop_video)
+            except ValueError:
+                messagebox.showerror("Lỗi", "Không mở được file video.")
+                return
+        self.video_player.play()
+
+    def _stop_video(self):
+        if self.video_player is not None:
+            self.video_player.stop()
+            self.video_player = None
 
     def pause_video(self):
-        self.video_paused = not self.video_paused
+        if self.video_player is not None:
+            self.video_player.toggle()
 
     def skip_video(self):
-        # naive skip: stop and restart reader + jump approx 5s forward by setting CAP_PROP_POS_MSEC
+        # tua thật: thread giải mã seek tới vị trí mới, các khung cũ trong hàng đợi bị bỏ
         if not self.video_path or not os.path.exists(self.video_path):
             return
         # if not running, just start playing
-        if not self.video_running:
+        if self.video_player is None:
             self.play_video()
             return
-        # set flag to pause then reposition by reopening capture in thread loop - not trivial to do safely here
-        # For simplicity show message: skip implemented as restart from +5s when thread reads position
-        # We'll just pause and show info (robust seek needs more complex thread-safe design)
-        self.video_paused = True
-        messagebox.showinfo("Tua", "Tua hiện tại thực hiện bằng việc dừng rồi phát lại tại vị trí mong muốn (tạm thời giới hạn).")
+        self.video_player.skip(5)
 
     def toggle_fullscreen(self):
         self.root.attributes("-fullscreen", not self.root.attributes("-fullscreen"))
@@ -854,17 +777,26 @@ class GifApp:
     def stop_gif_animation(self):
         """Dừng animation GIF từ ảnh"""
         self.playing = False
-        self.gif_playing = False
+        if self.gif_player is not None:
+            self.gif_player.stop()
+            self.gif_player = None
 
     def stop_gif_from_video_animation(self):
         """Dừng animation GIF từ video"""
-        self.gif_from_video_playing = False
+        if self.gif_from_video_player is not None:
+            self.gif_from_video_player.stop()
+            self.gif_from_video_player = None
 
     def clear_list(self):
         # Dừng tất cả animation trước khi xóa
         self.stop_gif_animation()
         self.stop_gif_from_video_animation()
 
+        # Hủy các job còn làm việc trên danh sách ảnh cũ (thumbnail, render sẵn GIF)
+        self.jobs.cancel("thumbs")
+        self.jobs.cancel("gif_warm")
+        self.status_label.config(text="")
+
         # Xóa danh sách ảnh
         self.image_paths = []
 
@@ -882,16 +814,11 @@ class GifApp:
         self.gif_from_video_canvas.image = None
         self.gif_from_video_canvas.create_text(280, 200, text="(Chưa có GIF từ video)", fill="#333", font=("Arial", 12))
 
-        # Xóa các frame GIF lưu trong bộ nhớ
-        self.gif_frames = []
-        self.gif_from_video_frames = []
-        self.gif_index = 0
-        self.gif_from_video_index = 0
-
     def toggle_gif(self):
-        self.playing = not self.playing
-        if self.playing:
-            self._draw_gif_frame()
+        if self.gif_player is None:
+            return
+        self.gif_player.toggle()
+        self.playing = self.gif_player.playing
 
     # ----------------- Tab2 functions (Import video & extract) -----------------
     def select_import_video(self):
@@ -933,42 +860,39 @@ class GifApp:
         target_fps = int(self.target_fps_var.get())
         duration_requested = int(self.extract_duration_var.get())
         duration = min(duration_requested, MAX_EXTRACT_SECONDS)
-        # run in thread
-        t = threading.Thread(target=self._do_extract_frames, args=(self.import_video_path, target_fps, duration, self.output_folder), daemon=True)
-        t.start()
-
-    def _do_extract_frames(self, video_path, target_fps, duration, output_folder):
-        try:
-            info = extract_frames_from_video(video_path, target_fps, duration, output_folder)
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Lỗi extract", str(e)))
-            return
-        saved = info.get("saved_paths", [])
-        self.extract_saved = saved
-        # update UI thumbnails on main thread
-        self.root.after(0, lambda: self._show_extracted_thumbnails(saved))
-        self.root.after(0, lambda: messagebox.showinfo("Hoàn tất", f"Đã xuất {len(saved)} ảnh vào:\n{output_folder}"))
+        output_folder = self.output_folder
+
+        def done(saved):
+            self.status_label.config(text="")
+            self.extract_saved = saved
+            self._show_extracted_thumbnails(saved)
+            messagebox.showinfo("Hoàn tất", f"Đã xuất {len(saved)} ảnh vào:\n{output_folder}")
+
+        # chạy nền; yêu cầu xuất mới sẽ hủy lần xuất trước
+        self.jobs.submit("extract", self._do_extract_frames, self.import_video_path, target_fps, duration,
+                         output_folder, on_done=done,
+                         on_error=lambda e: self._show_job_error("Lỗi extract", e),
+                         on_progress=self._show_progress)
+
+    def _do_extract_frames(self, job, video_path, target_fps, duration, output_folder):
+        # tuần tự: đoạn video ngắn (tối đa MAX_EXTRACT_SECONDS), tạo process pool từ thread của app Tk
+        # tốn hơn cả việc giải mã, và fork một process đang chạy nhiều thread là không an toàn
+        info = extract_frames_from_video(video_path, target_fps, duration, output_folder, workers=1,
+                                         progress=lambda done, total: job.report(done, total, "Đang xuất frames"))
+        return info.get("saved_paths", [])
 
     def _show_extracted_thumbnails(self, paths):
+        self.jobs.cancel("extract_thumbs")  # thumbnail của lần xuất trước không lấp vào dải mới
         for w in self.extract_thumb_frame.winfo_children():
             w.destroy()
             # Xác định vị trí bắt đầu cho frames extract
         start_col = 1 if hasattr(self, 'extract_gif_label') and self.extract_gif_label.winfo_ismapped() else 0
-        for idx, p in enumerate(paths):
-            try:
-                img = Image.open(p)
-                img.thumbnail((160, 120))
-                tkimg = ImageTk.PhotoImage(img)
-                lbl = tk.Label(self.extract_thumb_frame, image=tkimg, bg="#fff")
-                lbl.image = tkimg
-                lbl.grid(row=0, column=start_col + idx, padx=6, pady=6)
-            except Exception as e:
-                print("Không thể mở thumb:", p, e)
-        self.extract_thumb_frame.update_idletasks()
-        self.extract_canvas.configure(scrollregion=self.extract_canvas.bbox("all"))
+        self._load_thumbnails("extract_thumbs", list(paths), (160, 120), self.extract_thumb_frame, start_col,
+                              "Không thể mở thumb:")
 
     def run(self):
         self.root.mainloop()
+        self.jobs.shutdown()
 
 if __name__ == "__main__":
     app = GifApp()
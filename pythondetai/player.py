@@ -0,0 +1,389 @@
+# player.py
+from PIL import Image, ImageTk
+import threading
+import queue
+import time
+import cv2
+
+from videoindex import get_index, seek_to_frame
+from resizer import fit_size, resize_array
+
+DEFAULT_WINDOW = 8
+DEFAULT_VIDEO_QUEUE = 8
+
+
+class _End:
+    """Đánh dấu hết một vòng của nguồn khung."""
+
+
+class FramePlayer:
+    """
+    Phát một chuỗi khung lên Canvas mà chỉ giữ một cửa sổ nhỏ quanh đầu phát.
+
+    source là hàm không tham số trả về iterable các ảnh PIL, hoặc các cặp (ảnh, thời lượng ms),
+    cho một vòng phát (vd. đọc lại file GIF, hoặc sinh lại khung xem trước). Một thread nền giải mã
+    trước tối đa `window` khung vào hàng đợi có giới hạn; luồng Tk lấy ra và dán vào
+    một vòng `window` PhotoImage dùng lại, nên bộ nhớ không tăng theo độ dài GIF.
+    Mỗi khung được giữ đúng thời lượng đi kèm nó; khung không kèm thời lượng (hoặc thời lượng 0)
+    giữ delay_ms mili giây, delay_ms là số hoặc hàm trả về số đó (đọc lại mỗi khung).
+    on_pass_end() được gọi trên luồng Tk mỗi khi phát xong một vòng (sau thời lượng của khung cuối).
+    """
+
+    def __init__(self, root, canvas, source, center, delay_ms=100, window=DEFAULT_WINDOW,
+                 loop=True, on_error=None, on_pass_end=None):
+        self.root = root
+        self.canvas = canvas
+        self.center = center
+        self._source = source
+        self._delay = delay_ms if callable(delay_ms) else (lambda: delay_ms)
+        self._loop = loop
+        self._on_error = on_error
+        self._on_pass_end = on_pass_end
+        self._ahead = queue.Queue(maxsize=max(1, window))
+        self._ring = [None] * max(1, window)
+        self._slot = 0
+        self._last_source = None
+        self._stop = threading.Event()
+        self._error = None
+        self._after = None
+        self._item = None
+        self.playing = False
+        self._thread = threading.Thread(target=self._decode, daemon=True)
+        self._thread.start()
+
+    # ---- thread giải mã ----
+    def _decode(self):
+        try:
+            while not self._stop.is_set():
+                count = 0
+                for item in self._source():
+                    frame, duration = item if isinstance(item, tuple) else (item, None)
+                    if frame.mode not in ("RGB", "RGBA"):
+                        frame = frame.convert("RGBA")
+                    if not self._put((frame, duration)):
+                        return
+                    count += 1
+                if not self._put(_End) or not count or not self._loop:
+                    return
+        except Exception as e:
+            self._error = e
+            self._put(_End)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._ahead.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # ---- luồng Tk ----
+    def play(self):
+        self.playing = True
+        self._tick()
+
+    def pause(self):
+        self.playing = False
+        self._cancel_tick()
+
+    def toggle(self):
+        if self.playing:
+            self.pause()
+        else:
+            self.play()
+
+    def stop(self):
+        """Dừng hẳn: dừng thread giải mã và giải phóng các PhotoImage."""
+        self.pause()
+        self._stop.set()
+        self._ring = [None] * len(self._ring)
+
+    def _cancel_tick(self):
+        if self._after is not None:
+            self.root.after_cancel(self._after)
+            self._after = None
+
+    def _tick(self):
+        self._cancel_tick()
+        if not self.playing:
+            return
+        try:
+            item = self._ahead.get_nowait()
+        except queue.Empty:
+            # Thread giải mã chưa kịp: chờ một chút rồi thử lại
+            self._after = self.root.after(10, self._tick)
+            return
+
+        if item is _End:
+            if self._error is not None:
+                self.stop()
+                if self._on_error is not None:
+                    self._on_error(self._error)
+                return
+            if self._loop and self._last_source is not None:
+                self._tick()
+            else:
+                self.playing = False
+            if self._on_pass_end is not None and self._last_source is not None:
+                self._on_pass_end()
+            return
+
+        frame, duration = item
+        if frame is not self._last_source:  # khung giữ nguyên không cần dán lại
+            self._last_source = frame
+            self._show(frame)
+        self._after = self.root.after(int(duration) if duration else self._delay(), self._tick)
+
+    def _show(self, frame):
+        # Dán vào PhotoImage kế tiếp trong vòng (không phải cái đang hiển thị);
+        # chỉ tạo mới khi chưa có hoặc khác kích thước
+        self._slot = (self._slot + 1) % len(self._ring)
+        photo = self._ring[self._slot]
+        if photo is None or photo.width() != frame.width or photo.height() != frame.height:
+            photo = self._ring[self._slot] = ImageTk.PhotoImage(frame)
+        else:
+            photo.paste(frame)
+        if self._item is None or not self.canvas.find_withtag(self._item):
+            self.canvas.delete("all")
+            self._item = self.canvas.create_image(*self.center, image=photo)
+        else:
+            self.canvas.itemconfig(self._item, image=photo)
+        self.canvas.image = photo  # tránh bị GC xoá
+
+
+def gif_file_frames(path):
+    """
+    Nguồn khung cho FramePlayer: giải mã lần lượt từng khung của file GIF,
+    kèm thời lượng riêng của khung đó (info["duration"], ms).
+    """
+    def frames():
+        with Image.open(path) as gif:
+            index = 0
+            while True:
+                try:
+                    gif.seek(index)
+                except EOFError:
+                    return
+                yield gif.convert("RGBA"), gif.info.get("duration")
+                index += 1
+    return frames
+
+
+class VideoPlayer:
+    """
+    Phát file video lên một Label theo đồng hồ monotonic, không trôi theo thời gian giải mã.
+
+    Thread giải mã đọc, thu nhỏ về max_size và đổi màu từng khung rồi đẩy vào hàng đợi
+    có giới hạn (queue_size khung) kèm mốc thời gian của khung. Luồng Tk trình chiếu mỗi
+    khung đúng lúc theo mốc đó (nhân tốc độ); khung đã trễ quá một chu kỳ mà phía sau
+    còn khung khác thì bị bỏ qua thay vì làm chậm cả video. seek() thực hiện ngay trên
+    thread giải mã, các khung cũ còn trong hàng đợi bị loại theo thế hệ (generation);
+    khi đã có chỉ mục video (lập nền từ lần seek đầu, không chặn) thì seek đi từ keyframe gần
+    nhất tới đúng khung, hoặc chỉ grab tiếp khi đích nằm ngay phía trước trong cùng GOP
+    (kéo thanh thời gian từng chút).
+    on_position(giây) được gọi mỗi khi một khung được hiển thị, on_end khi hết video (loop=False).
+    """
+
+    def __init__(self, root, label, path, max_size, queue_size=DEFAULT_VIDEO_QUEUE, loop=True,
+                 on_position=None, on_end=None):
+        self.root = root
+        self.path = path
+        self.label = label
+        self.max_size = max_size
+        self._loop = loop
+        self._on_position = on_position
+        self._on_end = on_end
+
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            self._cap.release()
+            raise ValueError(f"Không mở được video: {path}")
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 25.0
+        frame_count = self._cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        self.duration = frame_count / self.fps
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._seek_to = None
+        self._stop = threading.Event()
+
+        self.speed = 1.0
+        self.position = 0.0
+        self.playing = False
+        self.dropped = 0
+        self._pending = None
+        self._clock = None  # (thời điểm monotonic, mốc giây của khung) để neo lịch trình chiếu
+        self._show_next = False
+        self._after = None
+        self._photo = None
+
+        self._thread = threading.Thread(target=self._decode, daemon=True)
+        self._thread.start()
+
+    # ---- thread giải mã ----
+    def _decode(self):
+        cap = self._cap
+        generation = 0
+        anchor = True
+        index = None
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    seek_to, self._seek_to = self._seek_to, None
+                    generation = self._generation
+                if seek_to is not None:
+                    if index is None:
+                        # không chặn: lần seek đầu bắt đầu lập chỉ mục nền, các lần sau dùng khi đã xong
+                        index = get_index(self.path, wait=False)
+                    if index:
+                        current = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+                        seek_to_frame(cap, index, index.frame_at(seek_to), current)
+                    else:
+                        cap.set(cv2.CAP_PROP_POS_MSEC, seek_to * 1000)
+                    anchor = True
+
+                ret, frame = cap.read()
+                if not ret:
+                    if not self._loop:
+                        self._put((generation, None, None, False))
+                        self._wait_for_seek()
+                        continue
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # lặp lại
+                    anchor = True
+                    continue
+
+                pts = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                if self._put((generation, pts, self._prepare(frame), anchor), generation):
+                    anchor = False
+        finally:
+            cap.release()
+
+    def _prepare(self, frame):
+        frame = resize_array(frame, fit_size((frame.shape[1], frame.shape[0]), self.max_size))
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    def _put(self, item, generation=None):
+        # Bỏ khung đang chờ đẩy nếu đã có yêu cầu seek mới (hàng đợi đầy + khung lỗi thời)
+        while not self._stop.is_set():
+            if generation is not None and generation != self._generation:
+                return False
+            try:
+                self._queue.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _wait_for_seek(self):
+        while not self._stop.is_set() and self._seek_to is None:
+            time.sleep(0.02)
+
+    # ---- điều khiển (luồng Tk) ----
+    def play(self):
+        if self.playing:
+            return
+        self.playing = True
+        self._clock = None  # neo lại đồng hồ ở khung kế tiếp
+        self._tick()
+
+    def pause(self):
+        self.playing = False
+        self._cancel_tick()
+
+    def toggle(self):
+        if self.playing:
+            self.pause()
+        else:
+            self.play()
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self._clock = None
+
+    def seek(self, seconds):
+        """Tua tới vị trí seconds (giây); khi đang dừng vẫn hiển thị khung tại vị trí mới."""
+        seconds = max(0.0, min(seconds, self.duration))
+        with self._lock:
+            self._generation += 1
+            self._seek_to = seconds
+        self._pending = None
+        self._clock = None
+        self.position = seconds
+        if not self.playing:
+            self._show_next = True
+            self._tick()
+
+    def skip(self, delta):
+        self.seek(self.position + delta)
+
+    def stop(self):
+        """Dừng hẳn: dừng thread giải mã và giải phóng VideoCapture."""
+        self.pause()
+        self._stop.set()
+
+    def _cancel_tick(self):
+        if self._after is not None:
+            self.root.after_cancel(self._after)
+            self._after = None
+
+    def _next_item(self):
+        while True:
+            if self._pending is None:
+                try:
+                    self._pending = self._queue.get_nowait()
+                except queue.Empty:
+                    return None
+            if self._pending[0] == self._generation:
+                return self._pending
+            self._pending = None  # khung từ trước lần seek gần nhất
+
+    def _tick(self):
+        self._cancel_tick()
+        if self._stop.is_set() or not (self.playing or self._show_next):
+            return
+
+        while True:
+            item = self._next_item()
+            if item is None:
+                self._after = self.root.after(5, self._tick)  # chờ thread giải mã
+                return
+            _, pts, image, anchor = item
+            if pts is None:  # hết video
+                self._pending = None
+                self.pause()
+                if self._on_end is not None:
+                    self._on_end()
+                return
+
+            if not self.playing:  # đang dừng: chỉ hiện khung sau lần seek
+                self._pending = None
+                self._show_next = False
+                self._present(pts, image)
+                return
+
+            now = time.monotonic()
+            if anchor or self._clock is None:
+                self._clock = (now, pts)
+            due = self._clock[0] + (pts - self._clock[1]) / self.speed
+            if due > now:
+                self._after = self.root.after(max(1, int((due - now) * 1000)), self._tick)
+                return
+
+            self._pending = None
+            late = now - due > 1.0 / (self.fps * self.speed)
+            if late and not self._queue.empty():
+                self.dropped += 1  # trễ quá một chu kỳ: bỏ khung này, xét khung sau
+                continue
+            self._present(pts, image)
+            self._after = self.root.after(1, self._tick)  # nhường vòng sự kiện Tk rồi xét khung sau
+            return
+
+    def _present(self, pts, image):
+        self.position = pts
+        self._photo = ImageTk.PhotoImage(image)
+        self.label.config(image=self._photo)
+        self.label.image = self._photo  # tránh bị GC xoá
+        if self._on_position is not None:
+            self._on_position(pts)
@@ -1,12 +1,107 @@
 # processor.py
 from PIL import Image
+from collections import OrderedDict
+import threading
 
-def load_images(image_paths):
+from renderstats import resolve_stats
+from cachefiles import stat_key
+
+# Giới hạn bộ nhớ mặc định cho cache ảnh đã giải mã (byte)
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class ImageCache:
+    """
+    Cache LRU các ảnh RGB đã giải mã, khóa theo (đường dẫn, mtime, kích thước file)
+    nên file bị sửa sẽ tự được giải mã lại. Tổng bộ nhớ ảnh giữ trong cache
+    không vượt quá max_bytes; ảnh ít dùng gần đây nhất bị loại trước.
+    Dùng chung giữa các luồng.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, path):
+        """Trả về ảnh RGB của path, giải mã từ đĩa nếu chưa có trong cache."""
+        key = stat_key(path)
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+                return img
+        with Image.open(path) as src:
+            img = src.convert("RGB")
+        self._put(key, img)
+        return img
+
+    def _put(self, key, img):
+        size = self._image_bytes(img)
+        if size > self.max_bytes:
+            return  # ảnh lớn hơn cả giới hạn cache thì không giữ lại
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= self._image_bytes(old)
+            self._entries[key] = img
+            self.current_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, img = self._entries.popitem(last=False)
+            self.current_bytes -= self._image_bytes(img)
+
+    def set_limit(self, max_bytes):
+        """Đổi giới hạn bộ nhớ, loại bớt ảnh nếu đang vượt giới hạn mới."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Cache dùng chung cho cả tiến trình
+image_cache = ImageCache()
+
+
+def load_images(image_paths, use_cache=True, stats=None):
     """
     Trả về danh sách PIL.Image đã convert sang RGB.
+    Mặc định lấy qua image_cache nên các lần render lặp lại không phải giải mã lại.
+    Ảnh trong cache được dùng chung, không sửa trực tiếp trên ảnh trả về.
+    stats=True (hoặc một RenderStats) đo công đoạn load và trả về (danh sách, RenderStats).
+    """
+    st = resolve_stats(stats)
+    with st.render():
+        images = list(iter_images(image_paths, use_cache, st))
+    return (images, st) if stats else images
+
+def iter_images(image_paths, use_cache=True, stats=None):
     """
-    images = []
+    Giống load_images nhưng trả về generator: mỗi ảnh chỉ được giải mã khi cần,
+    dùng cho các chế độ ghi streaming để không giữ toàn bộ ảnh trong bộ nhớ.
+    stats: RenderStats nhận công đoạn load (thời gian giải mã hoặc lấy từ cache, số ảnh, số byte),
+    thường là cùng đối tượng truyền cho create_gif/create_video.
+    """
+    return resolve_stats(stats).track("load", _decode_images(image_paths, use_cache))
+
+def _decode_images(image_paths, use_cache):
     for path in image_paths:
-        img = Image.open(path).convert("RGB")
-        images.append(img)
-    return images
+        if use_cache:
+            yield image_cache.get(path)
+        else:
+            with Image.open(path) as img:
+                yield img.convert("RGB")
@@ -0,0 +1,142 @@
+# rendercache.py
+from collections import OrderedDict
+from io import BytesIO
+import hashlib
+import os
+import threading
+
+from cachefiles import atomic_path, stat_key
+from processor import image_cache, iter_images
+from animator import create_gif, sample_evenly
+
+# Giới hạn mặc định cho tầng bộ nhớ và tầng đĩa của cache kết quả render (byte)
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+DEFAULT_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+
+class RenderCache:
+    """
+    Cache kết quả render (bytes của file GIF), khóa theo hash nội dung các ảnh đầu vào
+    cùng các tham số render (fps, effect, inter_frames, ...).
+    Tầng bộ nhớ là LRU giới hạn theo max_bytes; nếu có disk_dir thì kết quả còn được
+    lưu xuống đĩa (giới hạn max_disk_bytes, file cũ nhất bị xóa trước) và dùng lại
+    giữa các lần chạy chương trình.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, disk_dir=None, max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._file_hashes = {}
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def file_hash(self, path):
+        """Hash nội dung file, chỉ đọc lại file khi mtime hoặc kích thước thay đổi."""
+        key = stat_key(path)
+        digest = self._file_hashes.get(key)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=20)
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            digest = h.hexdigest()
+            self._file_hashes[key] = digest
+        return digest
+
+    def make_key(self, image_paths, **params):
+        """Khóa cache từ nội dung các ảnh (theo thứ tự) và các tham số render."""
+        h = hashlib.blake2b(digest_size=20)
+        for path in image_paths:
+            h.update(self.file_hash(path).encode())
+        h.update(repr(sorted(params.items())).encode())
+        return h.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".gif")
+
+    def get(self, key):
+        """Trả về bytes đã render hoặc None nếu chưa có."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            with open(self._disk_path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._disk_path(key))  # đánh dấu vừa dùng cho việc dọn đĩa
+            self._put_memory(key, data)
+            return data
+        return None
+
+    def put(self, key, data):
+        self._put_memory(key, data)
+        if self.disk_dir and len(data) <= self.max_disk_bytes:
+            with atomic_path(self._disk_path(key)) as tmp, open(tmp, "wb") as f:
+                f.write(data)
+            self._evict_disk()
+
+    def _put_memory(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._entries[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".gif"):
+                path = os.path.join(self.disk_dir, name)
+                st = os.stat(path)
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+# Cache dùng chung cho cả tiến trình (chỉ tầng bộ nhớ)
+render_cache = RenderCache()
+
+
+def render_gif(image_paths, fps=10, effect='none', inter_frames=0, cache=None, images=None, **gif_options):
+    """
+    Trả về bytes GIF cho danh sách ảnh, dùng lại kết quả đã render nếu đầu vào
+    và tham số giống hệt. Khi chưa có, GIF được render streaming (ảnh đọc dần)
+    rồi lưu vào cache. gif_options được chuyển thẳng cho create_gif.
+    images: iterable ảnh đã giải mã dùng khi phải render (mặc định iter_images(image_paths)),
+    ví dụ để bọc thêm việc báo tiến độ.
+    Với palette='global', mẫu bảng màu là các ảnh lấy đều trên image_paths (qua image_cache)
+    nên không phụ thuộc việc images là generator.
+    """
+    cache = render_cache if cache is None else cache
+    key = cache.make_key(image_paths, fps=fps, effect=effect, inter_frames=inter_frames, **gif_options)
+    data = cache.get(key)
+    if data is None:
+        if images is None:
+            images = iter_images(image_paths)
+        if gif_options.get("palette") == 'global' and gif_options.get("palette_sample") is None:
+            gif_options["palette_sample"] = [image_cache.get(p) for p in sample_evenly(list(image_paths))]
+        buffer = create_gif(images, fps=fps, effect=effect, inter_frames=inter_frames,
+                            output=BytesIO(), **gif_options)
+        data = buffer.getvalue()
+        cache.put(key, data)
+    return data
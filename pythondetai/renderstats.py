@@ -0,0 +1,223 @@
+# renderstats.py
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Thứ tự các công đoạn trong report(), theo chiều đi của khung qua pipeline
+STAGE_ORDER = ("load", "decode", "normalize", "transition", "collapse", "quantize", "encode", "write",
+               "segments", "other")
+
+
+class StageStats:
+    """Số liệu của một công đoạn: thời gian (giây), số khung và số byte tạo ra."""
+
+    __slots__ = ("seconds", "frames", "bytes")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.frames = 0
+        self.bytes = 0
+
+    def as_dict(self):
+        return {"seconds": round(self.seconds, 6), "frames": self.frames, "bytes": self.bytes}
+
+
+def frame_nbytes(frame):
+    """Số byte điểm ảnh của một khung (mảng NumPy hoặc ảnh PIL)."""
+    if isinstance(frame, np.ndarray):
+        return frame.nbytes
+    return frame.width * frame.height * len(frame.getbands())
+
+
+@contextmanager
+def profiling(profiler):
+    """
+    Bật profiler trong khối with: đối tượng có enable()/disable() (vd. cProfile.Profile())
+    hoặc một hàm theo kiểu sys.setprofile(frame, event, arg). None thì không làm gì.
+    Chỉ theo dõi luồng hiện tại.
+    """
+    if profiler is None:
+        yield
+    elif hasattr(profiler, "enable"):
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+    else:
+        previous = sys.getprofile()
+        sys.setprofile(profiler)
+        try:
+            yield
+        finally:
+            sys.setprofile(previous)
+
+
+class RenderStats:
+    """
+    Thời gian, số khung và số byte theo từng công đoạn của một lần render
+    (load, normalize, transition, collapse, quantize, encode, write, ...).
+
+    Thời gian là thời gian riêng của công đoạn: khi công đoạn B chạy lồng trong A
+    (pipeline generator kéo khung từ công đoạn trước), phần của B không bị tính cho A.
+    Thời gian trong render() không thuộc công đoạn nào được tính vào "other"
+    (kể cả thời gian luồng chính chờ luồng mã hóa nền).
+    Mỗi luồng có ngăn xếp công đoạn riêng; công đoạn chạy trên luồng nền (vd. mã hóa video)
+    chồng lên luồng chính nên tổng các công đoạn có thể lớn hơn wall.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.wall = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _entry(self, name):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = StageStats()
+        return entry
+
+    def _push(self, name):
+        now = time.perf_counter()
+        stack = self._stack()
+        if stack:
+            outer = stack[-1]
+            with self._lock:
+                self._entry(outer[0]).seconds += now - outer[1]
+        stack.append([name, now])
+
+    def _pop(self):
+        now = time.perf_counter()
+        stack = self._stack()
+        name, start = stack.pop()
+        with self._lock:
+            self._entry(name).seconds += now - start
+        if stack:
+            stack[-1][1] = now  # công đoạn ngoài chạy tiếp từ đây
+
+    @contextmanager
+    def stage(self, name):
+        """Tính thời gian của khối with vào công đoạn name."""
+        self._push(name)
+        try:
+            yield
+        finally:
+            self._pop()
+
+    def count(self, name, frames=0, nbytes=0):
+        with self._lock:
+            entry = self._entry(name)
+            entry.frames += frames
+            entry.bytes += nbytes
+
+    def track(self, name, iterable, nbytes=frame_nbytes):
+        """
+        Bọc iterable: thời gian lấy mỗi phần tử được tính vào công đoạn name,
+        mỗi phần tử là một khung với nbytes(phần tử) byte.
+        Lồng trong chính công đoạn name (vd. iter_images đưa vào create_gif) thì không đếm lại.
+        """
+        it = iter(iterable)
+        while True:
+            if any(entry[0] == name for entry in self._stack()):
+                item = next(it, _DONE)
+                if item is _DONE:
+                    return
+                yield item
+                continue
+            self._push(name)
+            try:
+                item = next(it, _DONE)
+            finally:
+                self._pop()
+            if item is _DONE:
+                return
+            self.count(name, 1, nbytes(item))
+            yield item
+
+    @contextmanager
+    def render(self, profiler=None):
+        """
+        Bao một lần render: đo wall và bật profiler (xem profiling) trong khối with.
+        Render lồng trong render khác cùng đối tượng thống kê (create_gif_from_video
+        gọi create_gif) chỉ được tính ở lần ngoài cùng.
+        """
+        outer = not self._stack()
+        start = time.perf_counter()
+        if outer:
+            self._push("other")
+        try:
+            with profiling(profiler):
+                yield self
+        finally:
+            if outer:
+                self._pop()
+                self.wall += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            "wall": round(self.wall, 6),
+            "stages": {name: entry.as_dict() for name, entry in self.stages.items()},
+        }
+
+    def report(self):
+        """Bảng tóm tắt dạng chữ, mỗi công đoạn một dòng theo STAGE_ORDER."""
+        rank = {name: i for i, name in enumerate(STAGE_ORDER)}
+        names = sorted(self.stages, key=lambda n: rank.get(n, rank["other"] - 0.5))
+        lines = [f"{'công đoạn':<12}{'giây':>10}{'%':>7}{'khung':>8}{'MB':>10}"]
+        for name in names:
+            entry = self.stages[name]
+            share = 100 * entry.seconds / self.wall if self.wall else 0.0
+            lines.append(f"{name:<12}{entry.seconds:>10.3f}{share:>7.1f}{entry.frames:>8}"
+                         f"{entry.bytes / 1e6:>10.1f}")
+        lines.append(f"{'wall':<12}{self.wall:>10.3f}")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"RenderStats(wall={self.wall:.3f}s, stages={list(self.stages)})"
+
+
+class _NullStats(RenderStats):
+    """Thống kê rỗng dùng khi không bật đo: không ghi gì, chỉ còn profiler."""
+
+    def __bool__(self):
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, frames=0, nbytes=0):
+        pass
+
+    def track(self, name, iterable, nbytes=frame_nbytes):
+        return iterable
+
+    @contextmanager
+    def render(self, profiler=None):
+        with profiling(profiler):
+            yield self
+
+
+_DONE = object()
+NO_STATS = _NullStats()
+
+
+def resolve_stats(stats):
+    """
+    Tham số stats của các hàm render: None/False -> NO_STATS (không đo),
+    True -> RenderStats mới, RenderStats -> ghi tiếp vào đối tượng đó.
+    Hàm render trả về (kết quả, thống kê) khi stats được bật.
+    """
+    if isinstance(stats, RenderStats):
+        return stats
+    return RenderStats() if stats else NO_STATS
@@ -0,0 +1,51 @@
+# resizer.py
+from PIL import Image
+import cv2
+import numpy as np
+
+# Mode ảnh PIL có thể chuyển thẳng sang mảng uint8 cho cv2.resize
+_CV2_MODES = ("RGB", "RGBA", "L")
+
+
+def fit_size(size, max_size, upscale=False):
+    """Kích thước (w, h) giữ tỉ lệ để vừa khung max_size; mặc định không phóng to."""
+    w, h = size
+    scale = min(max_size[0] / w, max_size[1] / h)
+    if not upscale:
+        scale = min(scale, 1.0)
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+def resize_array(arr, size):
+    """
+    Resize mảng uint8 (H,W[,C]) về size=(w, h) bằng OpenCV:
+    INTER_AREA khi thu nhỏ (không răng cưa), INTER_CUBIC khi phóng to.
+    """
+    h, w = arr.shape[:2]
+    if (w, h) == tuple(size):
+        return arr
+    shrink = size[0] <= w and size[1] <= h
+    return cv2.resize(arr, tuple(size), interpolation=cv2.INTER_AREA if shrink else cv2.INTER_CUBIC)
+
+
+def resize_image(img, size):
+    """
+    Resize ảnh PIL về size=(w, h), chọn cách nhanh mà vẫn đúng theo tỉ lệ thu nhỏ:
+    - thu nhỏ từ 2 lần trở lên: reduce() theo số nguyên (trung bình khối, rất nhanh)
+      rồi lọc LANCZOS phần còn lại;
+    - thu nhỏ ít hơn 2 lần: cv2.resize INTER_AREA trên mảng;
+    - phóng to: BICUBIC.
+    Các mode khác RGB/RGBA/L dùng resize của Pillow.
+    """
+    size = tuple(size)
+    if img.size == size:
+        return img
+    w, h = img.size
+    if img.mode not in _CV2_MODES:
+        return img.resize(size, Image.LANCZOS, reducing_gap=2.0)  # P, 1, I;16... để Pillow tự xử lý
+    if size[0] > w or size[1] > h:
+        return img.resize(size, Image.BICUBIC)
+    factor = min(w // size[0], h // size[1])
+    if factor >= 2:
+        return img.reduce(factor).resize(size, Image.LANCZOS)
+    return Image.fromarray(resize_array(np.asarray(img), size))
@@ -0,0 +1,137 @@
+# scheduler.py
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import traceback
+
+
+class JobCancelled(Exception):
+    """Ném ra trong hàm của job khi job đã bị hủy hoặc bị thay bằng yêu cầu mới hơn."""
+
+
+class Job:
+    """
+    Một công việc chạy nền. Hàm của job nhận đối tượng này làm tham số đầu tiên
+    để kiểm tra hủy (check / track) và báo tiến độ (report).
+    """
+
+    def __init__(self, scheduler, key, on_progress=None):
+        self.key = key
+        self._scheduler = scheduler
+        self._on_progress = on_progress
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        """Ném JobCancelled nếu job đã bị hủy."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def report(self, done, total=None, message=None):
+        """Báo tiến độ; callback on_progress(done, total, message) chạy trên luồng Tk."""
+        self.check()
+        if self._on_progress is not None:
+            self._scheduler._post(self, self._on_progress, done, total, message)
+
+    def post(self, callback, *args):
+        """Gọi callback(*args) trên luồng Tk, bỏ qua nếu job đã bị hủy (vd. để hiển thị kết quả từng phần)."""
+        self.check()
+        self._scheduler._post(self, callback, *args)
+
+    def track(self, iterable, total=None, message=None):
+        """Bọc một iterable: kiểm tra hủy và báo tiến độ sau mỗi phần tử."""
+        self.report(0, total, message)
+        for done, item in enumerate(iterable, 1):
+            self.check()
+            yield item
+            self.report(done, total, message)
+
+
+class JobScheduler:
+    """
+    Chạy các tác vụ nặng (render, mã hóa, trích xuất) trên thread pool thay vì luồng Tk.
+    Mỗi job có một key (thường là tên tab/chức năng); gửi job mới cùng key sẽ hủy job cũ,
+    nên chỉ yêu cầu mới nhất của mỗi key được chạy tiếp và trả kết quả.
+    Mọi callback (on_done, on_error, on_progress) được gọi trên luồng Tk qua root.after.
+    Job không có on_error mà ném lỗi thì lỗi được in ra stderr.
+    Job nền (background=True: thumbnail, filmstrip, render sẵn) chạy trên pool riêng
+    background_workers luồng, nên thao tác của người dùng không phải xếp hàng sau chúng.
+    """
+
+    def __init__(self, root, workers=2, background_workers=1):
+        self.root = root
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._background_pool = ThreadPoolExecutor(max_workers=background_workers)
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, on_done=None, on_error=None, on_progress=None, background=False, **kwargs):
+        """Chạy fn(job, *args, **kwargs) trên worker (pool nền nếu background), trả về Job để có thể hủy."""
+        job = Job(self, key, on_progress)
+        with self._lock:
+            previous = self._latest.get(key)
+            self._latest[key] = job
+        if previous is not None:
+            previous.cancel()
+        pool = self._background_pool if background else self._pool
+        pool.submit(self._run, job, fn, args, kwargs, on_done, on_error)
+        return job
+
+    def _run(self, job, fn, args, kwargs, on_done, on_error):
+        if job.cancelled:
+            self._finish(job)  # đã bị hủy hoặc có yêu cầu mới hơn trước khi job kịp chạy
+            return
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self._finish(job)
+            return
+        except Exception as e:
+            if on_error is not None:
+                self._post(job, on_error, e, final=True)
+            else:
+                # job không có on_error: vẫn in lỗi ra thay vì nuốt mất
+                print(f"Lỗi job {job.key}:")
+                traceback.print_exception(type(e), e, e.__traceback__)
+                self._finish(job)
+            return
+        if on_done is not None:
+            self._post(job, on_done, result, final=True)
+        else:
+            self._finish(job)
+
+    def _post(self, job, callback, *args, final=False):
+        def deliver():
+            if final:
+                self._finish(job)
+            if not job.cancelled:
+                callback(*args)
+        self.root.after(0, deliver)
+
+    def _finish(self, job):
+        with self._lock:
+            if self._latest.get(job.key) is job:
+                del self._latest[job.key]
+
+    def cancel(self, key=None):
+        """Hủy job đang chạy của key, hoặc mọi job nếu key là None."""
+        with self._lock:
+            jobs = list(self._latest.values()) if key is None else [self._latest.get(key)]
+        for job in jobs:
+            if job is not None:
+                job.cancel()
+
+    def is_running(self, key):
+        with self._lock:
+            return key in self._latest
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.shutdown(wait=False)
+        self._background_pool.shutdown(wait=False)
+
@@ -0,0 +1,174 @@
+# thumbnails.py
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image
+from bisect import bisect_left
+import math
+import os
+import cv2
+import numpy as np
+
+from animator import iter_video_frames
+from resizer import fit_size, resize_array, resize_image
+from cachefiles import atomic_path, cache_dir, hashed_name, stat_key
+
+# Thư mục mặc định lưu thumbnail giữa các lần chạy chương trình
+DEFAULT_CACHE_DIR = cache_dir("thumbnails")
+
+# Filmstrip để kéo thanh thời gian: mỗi FILMSTRIP_INTERVAL giây một khung nhỏ cỡ FILMSTRIP_TILE,
+# video dài thì giãn khoảng cách để không quá FILMSTRIP_MAX_TILES khung
+FILMSTRIP_INTERVAL = 1.0
+FILMSTRIP_TILE = (192, 108)
+FILMSTRIP_MAX_TILES = 400
+
+
+class Filmstrip:
+    """
+    Các khung thu nhỏ của một video lấy đều mỗi interval giây (mảng RGB uint8), kèm mốc
+    thời gian thật của từng khung trong times (mốc không đọc được bị bỏ qua, nên khung thứ i
+    không nhất thiết nằm ở i * interval). Được lấp dần khi đang tạo nên có thể dùng ngay
+    những khung đã có.
+    """
+
+    def __init__(self, interval, tiles=None, times=None):
+        self.interval = interval
+        self.tiles = list(tiles) if tiles is not None else []
+        if times is None:
+            times = [i * interval for i in range(len(self.tiles))]  # file cache cũ không lưu mốc
+        self.times = [float(t) for t in times]
+        self.complete = tiles is not None
+
+    def append(self, seconds, tile):
+        # khung trước, mốc sau: luồng Tk đọc times trong lúc đang tạo luôn thấy đủ khung tương ứng
+        self.tiles.append(tile)
+        self.times.append(float(seconds))
+
+    def tile_at(self, seconds):
+        """Ảnh PIL của khung có mốc gần seconds nhất, hoặc None nếu khung quanh đó chưa được tạo."""
+        if not self.tiles:
+            return None
+        i = bisect_left(self.times, seconds)
+        if i == len(self.times):
+            # sau khung cuối đã có: khi đang tạo thì khung gần hơn có thể chưa tới
+            if not self.complete and seconds - self.times[-1] > self.interval / 2:
+                return None
+            i -= 1
+        elif i > 0 and seconds - self.times[i - 1] <= self.times[i] - seconds:
+            i -= 1
+        return Image.fromarray(self.tiles[i])
+
+
+class ThumbnailService:
+    """
+    Tạo thumbnail cho dải xem trước.
+    JPEG được giải mã thẳng ở độ phân giải thu nhỏ (draft mode) thay vì giải mã đầy đủ rồi mới thu nhỏ;
+    nhiều ảnh được xử lý song song trên thread pool; thumbnail đã tạo được lưu xuống cache_dir
+    (PNG, khóa theo đường dẫn + mtime + kích thước file + cỡ thumbnail) nên mở lại cùng thư mục là có ngay.
+    cache_dir=None thì không dùng cache đĩa.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+        self.cache_dir = cache_dir
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1))
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+            except OSError:
+                self.cache_dir = None  # không ghi được thì chỉ tạo thumbnail, không cache
+
+    def _cache_path(self, path, size):
+        return os.path.join(self.cache_dir, hashed_name((stat_key(path), tuple(size)), ".png"))
+
+    def thumbnail(self, path, size):
+        """Trả về ảnh PIL đã thu nhỏ để vừa khung size (giữ tỉ lệ)."""
+        cache_path = self._cache_path(path, size) if self.cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with Image.open(cache_path) as cached:
+                    cached.load()
+                    return cached
+            except OSError:
+                pass  # file cache hỏng: tạo lại
+
+        with Image.open(path) as img:
+            img.draft("RGB", size)  # chỉ có tác dụng với JPEG: giải mã ở tỉ lệ 1/2, 1/4, 1/8
+            img.load()
+            if img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGBA")
+            img = resize_image(img, fit_size(img.size, size))
+
+        if cache_path:
+            try:
+                with atomic_path(cache_path) as tmp:
+                    img.save(tmp, "PNG")
+            except OSError:
+                pass
+        return img
+
+    def iter_thumbnails(self, paths, size):
+        """
+        Tạo thumbnail song song, trả về (vị trí, đường dẫn, ảnh, lỗi) theo thứ tự hoàn thành
+        để dải xem trước được lấp dần. Đóng generator giữa chừng sẽ hủy các ảnh chưa bắt đầu.
+        """
+        futures = {self._pool.submit(self.thumbnail, path, size): (idx, path) for idx, path in enumerate(paths)}
+        try:
+            for future in as_completed(futures):
+                idx, path = futures[future]
+                try:
+                    yield idx, path, future.result(), None
+                except Exception as e:
+                    yield idx, path, None, e
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _filmstrip_path(self, path, interval, tile_size):
+        return os.path.join(self.cache_dir, hashed_name((stat_key(path), interval, tuple(tile_size)), ".npz"))
+
+    def filmstrip(self, path, duration, tile_size=FILMSTRIP_TILE, on_tile=None):
+        """
+        Filmstrip của video path (dài duration giây): lấy từ cache đĩa nếu có, nếu không thì giải mã
+        (theo chỉ mục video, thu nhỏ ngay khi giải mã) và lưu lại. on_tile(strip, done, total) được gọi
+        sau mỗi khung để giao diện dùng ngay phần đã có; ném lỗi trong on_tile sẽ dừng việc tạo.
+        """
+        interval = max(FILMSTRIP_INTERVAL, duration / FILMSTRIP_MAX_TILES)
+        cache_path = self._filmstrip_path(path, interval, tile_size) if self.cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as data:
+                    strip = Filmstrip(interval, data["tiles"], data["times"] if "times" in data.files else None)
+                if on_tile is not None:
+                    on_tile(strip, len(strip.tiles), len(strip.tiles))
+                return strip
+            except (OSError, ValueError, KeyError):
+                pass  # file cache hỏng: tạo lại
+
+        timestamps = [i * interval for i in range(max(1, math.ceil(duration / interval)))]
+        strip = Filmstrip(interval)
+        for ts, frame in iter_video_frames(path, timestamps, with_timestamps=True):
+            tile = resize_array(frame, fit_size((frame.shape[1], frame.shape[0]), tile_size, upscale=True))
+            strip.append(ts, cv2.cvtColor(tile, cv2.COLOR_BGR2RGB))
+            if on_tile is not None:
+                on_tile(strip, len(strip.tiles), len(timestamps))
+        strip.complete = True
+
+        if cache_path and strip.tiles:
+            try:
+                with atomic_path(cache_path) as tmp, open(tmp, "wb") as f:
+                    np.savez_compressed(f, tiles=np.stack(strip.tiles), times=np.asarray(strip.times))
+            except OSError:
+                pass
+        return strip
+
+    def clear(self):
+        """Xóa toàn bộ thumbnail và filmstrip trong cache đĩa."""
+        if not self.cache_dir:
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith((".png", ".npz")):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+
+thumbnail_service = ThumbnailService()
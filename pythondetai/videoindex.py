@@ -0,0 +1,186 @@
+# videoindex.py
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from cachefiles import atomic_path, cache_dir, hashed_name, stat_key
+
+# Thư mục mặc định lưu chỉ mục video giữa các lần chạy chương trình
+DEFAULT_CACHE_DIR = cache_dir("videoindex")
+
+# OpenCV cũ không có thuộc tính này thì không biết được khung nào là keyframe
+_HAS_KEY_FRAME = getattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME", None)
+
+# Backend FFmpeg của OpenCV seek tới keyframe trước (đích - 16 khung) rồi giải mã dần tới đích
+_SEEK_BACKOFF = 16
+
+# Khi không biết keyframe: chỉ grab tiếp nếu đích cách vị trí hiện tại không quá chừng này khung
+# (như _SEQUENTIAL_MAX_GAP của animator), xa hơn thì để backend tự seek
+_BLIND_GRAB_LIMIT = 120
+
+
+class VideoIndex:
+    """
+    Chỉ mục của một file video: mốc thời gian (giây) của từng khung theo thứ tự trình chiếu
+    và chỉ số các keyframe. Dùng để lập kế hoạch seek: "seek tới keyframe K rồi grab N khung",
+    hoặc chỉ grab tiếp nếu từ vị trí hiện tại tới đích ít khung phải giải mã hơn.
+    keyframes_known=False: backend không báo được keyframe (không có chế độ raw hoặc
+    CAP_PROP_LRF_HAS_KEY_FRAME), khi đó chỉ grab tiếp trong phạm vi _BLIND_GRAB_LIMIT khung.
+    """
+
+    def __init__(self, fps, timestamps, keyframes, keyframes_known=True):
+        self.fps = fps
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        keyframes = np.asarray(keyframes, dtype=np.int64)
+        self.keyframes = keyframes if len(keyframes) and keyframes[0] == 0 else np.insert(keyframes, 0, 0)
+        self.keyframes_known = bool(keyframes_known)
+
+    @property
+    def frame_count(self):
+        return len(self.timestamps)
+
+    @property
+    def duration(self):
+        return self.frame_count / self.fps if self.fps else 0.0
+
+    def frame_at(self, seconds):
+        """Chỉ số khung hiển thị tại thời điểm seconds (làm tròn tới khung gần nhất)."""
+        if not self.frame_count:
+            return 0
+        # +1e-9: mốc đúng nửa khung làm tròn lên như int(ts * fps + 0.5)
+        i = int(np.searchsorted(self.timestamps, seconds + 0.5 / self.fps + 1e-9, side="right")) - 1
+        return min(max(i, 0), self.frame_count - 1)
+
+    def keyframe_before(self, frame):
+        """Keyframe gần nhất không sau khung frame."""
+        k = int(np.searchsorted(self.keyframes, frame, side="right")) - 1
+        return int(self.keyframes[max(k, 0)])
+
+    def plan_seek(self, frame, current=None):
+        """
+        Kế hoạch để lần grab() kế tiếp trả về khung frame: (keyframe, số khung phải giải mã).
+        Seek sẽ rơi vào keyframe K trước (frame - _SEEK_BACKOFF) rồi giải mã tới đích;
+        current là chỉ số khung mà decoder sẽ trả ở lần grab() tới — nếu grab tiếp từ đó
+        tốn ít khung hơn thì trả về (None, frame - current), tức là không seek.
+        Khi không biết keyframe, số khung phải giải mã sau seek là None (không ước lượng được).
+        """
+        if not self.keyframes_known:
+            if current is not None and 0 <= frame - current <= _BLIND_GRAB_LIMIT:
+                return None, frame - current
+            return frame, None
+        key = self.keyframe_before(max(frame - _SEEK_BACKOFF, 0))
+        if current is not None and current <= frame and frame - current <= frame - key:
+            return None, frame - current
+        return key, frame - key
+
+    @classmethod
+    def build(cls, path):
+        """Quét file một lần để lấy mốc thời gian và keyframe (chỉ tách gói, không giải mã nếu được)."""
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise ValueError(f"Không mở được video: {path}")
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            # Chế độ raw (CAP_PROP_FORMAT = -1): grab() chỉ đọc gói nén, rất nhanh
+            cap.set(cv2.CAP_PROP_FORMAT, -1)
+            pts, keys = [], []
+            while cap.grab():
+                t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                pts.append(t)
+                if _HAS_KEY_FRAME is not None and cap.get(_HAS_KEY_FRAME):
+                    keys.append(t)
+        finally:
+            cap.release()
+        # Gói nằm theo thứ tự giải mã (có B-frame); sắp lại theo thứ tự trình chiếu
+        timestamps = np.sort(np.asarray(pts, dtype=np.float64))
+        keyframes = np.unique(np.searchsorted(timestamps, np.asarray(keys, dtype=np.float64)))
+        return cls(fps, timestamps, keyframes, keyframes_known=bool(keys))
+
+    def save(self, path):
+        with atomic_path(path) as tmp, open(tmp, "wb") as f:
+            np.savez(f, fps=np.float64(self.fps), timestamps=self.timestamps, keyframes=self.keyframes,
+                     keyframes_known=np.bool_(self.keyframes_known))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            # file cache cũ không có keyframes_known: chỉ có keyframe 0 coi như không biết
+            known = bool(data["keyframes_known"]) if "keyframes_known" in data.files else len(data["keyframes"]) > 1
+            return cls(float(data["fps"]), data["timestamps"], data["keyframes"], known)
+
+
+def seek_to_frame(cap, index, frame, current=None):
+    """
+    Đưa cap tới khung frame theo kế hoạch của index, để lần read()/grab() kế tiếp trả về đúng khung đó.
+    current: chỉ số khung mà cap sẽ trả ở lần grab() tới (None nếu không rõ, luôn seek).
+    Trả về False nếu video kết thúc trước khi tới khung.
+    """
+    key, skip = index.plan_seek(frame, current)
+    if key is not None:
+        # backend tự đi từ keyframe key và giải mã skip khung tới đích
+        return cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+    for _ in range(skip):
+        if not cap.grab():
+            return False
+    return True
+
+
+_memory = {}
+_memory_lock = threading.Lock()
+_building = {}  # khóa file -> thread đang lập chỉ mục nền
+
+
+def _load_or_build(path, key, directory):
+    cache_file = os.path.join(directory, hashed_name(key, ".npz")) if directory else None
+    index = None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            index = VideoIndex.load(cache_file)
+        except (OSError, ValueError, KeyError):
+            index = None  # file cache hỏng: lập lại
+    if index is None:
+        try:
+            index = VideoIndex.build(path)
+        except ValueError:
+            index = None
+        if index is not None and not index.frame_count:
+            index = None
+        if index is not None and cache_file:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                index.save(cache_file)
+            except OSError:
+                pass
+    with _memory_lock:
+        _memory[key] = index or False  # False: đã thử và không lập được, không quét lại
+        _building.pop(key, None)
+    return index
+
+
+def get_index(path, cache_dir=DEFAULT_CACHE_DIR, wait=True):
+    """
+    Chỉ mục của video path: lấy từ bộ nhớ, rồi từ cache đĩa (khóa theo đường dẫn + mtime + kích thước),
+    nếu chưa có thì quét file và lưu lại. Trả về None nếu không lập được chỉ mục.
+    wait=False: không chặn để quét file — nếu chỉ mục chưa có trong bộ nhớ thì bắt đầu nạp/lập
+    trên một thread nền (một lần cho mỗi file) và trả về None ngay; người gọi seek theo cách
+    thường cho tới khi chỉ mục sẵn sàng.
+    """
+    key = stat_key(path)
+    with _memory_lock:
+        index = _memory.get(key)
+        if index is not None:
+            return index or None
+        if not wait:
+            if key not in _building:
+                thread = threading.Thread(target=_load_or_build, args=(path, key, cache_dir), daemon=True)
+                _building[key] = thread
+                thread.start()
+            return None
+        thread = _building.get(key)
+    if thread is not None:
+        thread.join()  # đang lập nền: chờ kết quả thay vì quét lần nữa
+        with _memory_lock:
+            return _memory.get(key) or None
+    return _load_or_build(path, key, cache_dir)